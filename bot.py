@@ -1,5 +1,7 @@
-import os, time, aiosqlite, signal, asyncio
-from datetime import datetime, timezone, timedelta
+import os, time, aiosqlite, signal, asyncio, logging, threading
+import numpy as np
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone, timedelta
 import discord
 from discord import app_commands
 from discord.ext import tasks
@@ -7,18 +9,36 @@ from dotenv import load_dotenv
 import io
 import matplotlib
 matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import shutil
 from discord.errors import NotFound, Forbidden
 from discord.utils import escape_markdown
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
+from functools import lru_cache
+
+
+# -------- Logging --------
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+_log = logging.getLogger("voicebot")
 
 
 # -------- Env --------
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 TZ_NAME = os.getenv("TIMEZONE", "Europe/Stockholm")
-AFK_CHANNEL_ID = int(os.getenv("AFK_CHANNEL_ID", "0"))
+
+# Local timezone, resolved once. ZoneInfo() reads and parses a tzdata file,
+# so constructing it per call (or worse, per row) was pure overhead.
+try:
+    import zoneinfo
+    LOCAL_TZ = zoneinfo.ZoneInfo(TZ_NAME)
+except Exception:
+    LOCAL_TZ = timezone.utc
+# Comma-separated list of channels to exclude from stats (historically one).
+AFK_CHANNEL_IDS = tuple(
+    int(c) for c in os.getenv("AFK_CHANNEL_ID", "0").split(",") if int(c or "0")
+)
 GUILD_ID = os.getenv("GUILD_ID")
 GUILD_OBJ = discord.Object(id=int(GUILD_ID)) if GUILD_ID else None
 VOICE_TOP_PRIVATE_USER = int(os.getenv("VOICE_TOP_PRIVATE_USER", "0"))
@@ -85,121 +105,364 @@ DB_PATH = "bot.db"
 PLOT_SIZE = (15, 5)
 
 
+def new_chart(figsize=PLOT_SIZE):
+    """A Figure + axes on a standalone Agg canvas.
+
+    Bypasses pyplot entirely: no global figure manager, no lock, and no
+    plt.close() bookkeeping — the figure is garbage-collected with the
+    handler frame. 100 dpi halves the pixel count of the old 150 dpi
+    renders, which is plenty for Discord previews.
+    """
+    fig = Figure(figsize=figsize, dpi=100)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    return fig, ax
+
+
+# One figure shared by all plain bar charts: constructing a Figure (and its
+# axes machinery) is a large slice of a simple render, so reuse it and just
+# clear the axes between calls. The threading.Lock matters because renders
+# run in asyncio.to_thread workers and a Figure is not thread-safe.
+_BAR_FIG = Figure(figsize=PLOT_SIZE, dpi=100)
+FigureCanvasAgg(_BAR_FIG)
+_BAR_AX = _BAR_FIG.add_subplot(111)
+_BAR_LOCK = threading.Lock()
+
+# Every render writes through one reused BytesIO instead of allocating a
+# fresh buffer per chart; PNGs run to hundreds of kB, and churning that
+# through the allocator on each command fragments a long-running process.
+_RENDER_BUF = io.BytesIO()
+_RENDER_LOCK = threading.Lock()
+
+
+def fig_to_png(fig: Figure) -> bytes:
+    """Rasterize a figure to PNG bytes through the shared render buffer."""
+    with _RENDER_LOCK:
+        _RENDER_BUF.seek(0)
+        _RENDER_BUF.truncate(0)
+        fig.savefig(_RENDER_BUF, format="png")
+        return _RENDER_BUF.getvalue()
+
+
+def render_bar_png(labels, values, title, xlabel, ylabel, rotate_labels=False) -> bytes:
+    """Render a plain bar chart to PNG bytes.
+
+    Synchronous on purpose: handlers run it via asyncio.to_thread so the
+    Agg rasterization (which releases the GIL) happens off the event loop
+    and voice-state events keep flowing during a render.
+    """
+    with _BAR_LOCK:
+        ax = _BAR_AX
+        ax.clear()
+        x = range(len(labels))
+        ax.bar(x, values)
+        if rotate_labels:
+            ax.set_xticks(x, labels, rotation=45, ha="right")
+        else:
+            ax.set_xticks(x, labels)
+        ax.set_title(title)
+        ax.set_ylabel(ylabel)
+        ax.set_xlabel(xlabel)
+        _BAR_FIG.tight_layout()
+        return fig_to_png(_BAR_FIG)
+
+
+# -------- Chart PNG cache --------
+# Server-wide charts change slowly — a closed hour never changes again — so
+# repeat invocations within the same five-minute bucket resend the already-
+# rendered PNG instead of re-querying and re-plotting. Keys include the time
+# bucket, so entries invalidate themselves as the clock rolls over.
+_png_cache: dict[tuple, bytes] = {}
+_PNG_CACHE_MAX = 64
+
+
+def cached_png(key: tuple) -> bytes | None:
+    return _png_cache.get(key)
+
+
+def store_png(key: tuple, data: bytes) -> bytes:
+    if len(_png_cache) >= _PNG_CACHE_MAX:
+        _png_cache.pop(next(iter(_png_cache)))  # drop the oldest insert
+    _png_cache[key] = data
+    return data
+
+
+# -------- Database connections --------
+# Long-lived connections shared by every handler. Opening a fresh aiosqlite
+# connection per event spins up a worker thread, re-reads the WAL header, and
+# starts with a cold page cache — noticeable on the Pi's SD card.
+#
+# WAL gives us cheap concurrency: one read-write connection (serialized with
+# a lock) handles joins/leaves, while a handful of read-only connections serve
+# leaderboard scans against WAL snapshots without queueing behind the writer.
+class SqlitePool:
+    """One RW connection plus a small set of read-only connections."""
+
+    def __init__(self, path: str, readers: int = 4):
+        self._path = path
+        self._writer: aiosqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+        self._readers: deque[aiosqlite.Connection] = deque()
+        self._reader_sem = asyncio.Semaphore(readers)
+
+    # sqlite3 keeps a per-connection cache of compiled statements keyed by SQL
+    # text; now that connections are long-lived this means each query is
+    # parsed and planned once, then reused. The default cache (128) is close
+    # to our distinct-statement count, so give it headroom.
+    STATEMENT_CACHE = 256
+
+    async def _open_writer(self) -> aiosqlite.Connection:
+        if self._writer is None:
+            self._writer = await aiosqlite.connect(
+                self._path, cached_statements=self.STATEMENT_CACHE
+            )
+            await self._writer.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            PRAGMA temp_store = MEMORY;
+            PRAGMA cache_size = -64000;
+            PRAGMA mmap_size = 134217728;
+            """)
+        return self._writer
+
+    @asynccontextmanager
+    async def writer(self):
+        """The read-write connection — serialized so commits never interleave."""
+        cx = await self._open_writer()
+        async with self._write_lock:
+            yield cx
+
+    @asynccontextmanager
+    async def reader(self):
+        """A read-only connection; SQLite skips all write machinery for these."""
+        async with self._reader_sem:
+            if self._readers:
+                cx = self._readers.popleft()
+            else:
+                cx = await aiosqlite.connect(
+                    f"file:{self._path}?mode=ro", uri=True,
+                    cached_statements=self.STATEMENT_CACHE
+                )
+                await cx.executescript("""
+                PRAGMA query_only = 1;
+                PRAGMA temp_store = MEMORY;
+                PRAGMA cache_size = -16000;
+                PRAGMA mmap_size = 134217728;
+                """)
+            try:
+                yield cx
+            finally:
+                self._readers.append(cx)
+
+    async def close(self):
+        while self._readers:
+            await self._readers.popleft().close()
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+
+pool = SqlitePool(DB_PATH)
+
+
+def db():
+    """Pooled read-only connection for queries.
+
+    Every voice_* command handler reads through here: the connections run
+    with query_only=1, so a SELECT can never touch the writer lock (and a
+    stray write raises immediately instead of blocking the event loop).
+    """
+    return pool.reader()
+
+
+def db_write():
+    """The pooled read-write connection for inserts/updates."""
+    return pool.writer()
+
+
+async def close_db():
+    """Close all pooled connections (graceful shutdown)."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    await pool.close()
+
+
+# -------- Debounced voice-event commits --------
+# Each voice event used to commit (and therefore fsync) individually; during
+# the join/leave storm after a stream or game ends, that fsync rate dominates
+# SD-card traffic. Events still execute immediately on the writer connection,
+# but the commit is deferred: it happens once FLUSH_AFTER_EVENTS writes are
+# pending or FLUSH_INTERVAL seconds after the first one, whichever comes
+# first. Readers see voice events at most ~1s late — harmless for stats —
+# and nothing is lost on planned shutdown because close_open_sessions
+# commits on the same connection.
+FLUSH_INTERVAL = 1.0
+FLUSH_AFTER_EVENTS = 25
+
+_pending_events = 0
+_flush_task: asyncio.Task | None = None
+
+
+async def _flush_events_later():
+    global _pending_events, _flush_task
+    try:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        async with db_write() as cx:
+            await cx.commit()
+        _pending_events = 0
+    finally:
+        _flush_task = None
+
+
+async def commit_soon(cx):
+    """Debounced commit for voice-event writes (caller holds the writer lock)."""
+    global _pending_events, _flush_task
+    _pending_events += 1
+    if _pending_events >= FLUSH_AFTER_EVENTS:
+        if _flush_task is not None:
+            _flush_task.cancel()
+            _flush_task = None
+        _pending_events = 0
+        await cx.commit()
+    elif _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_events_later())
+
+
 # -------- Utils --------
 def now_ts() -> int:
-    return int(time.time())
+    # time_ns avoids the float round-trip of time.time().
+    return time.time_ns() // 1_000_000_000
 
 
-def fmt_duration(seconds: int) -> str:
-    seconds = int(seconds or 0)
-    h = seconds // 3600
-    m = (seconds % 3600) // 60
+@lru_cache(maxsize=4096)
+def _fmt_duration_minutes(minutes: int) -> str:
+    h, m = divmod(minutes, 60)
     return f"{h}h {m}m"
 
 
+def fmt_duration(seconds: int) -> str:
+    # Cache on whole minutes: leaderboards repeat the same rounded totals a lot.
+    return _fmt_duration_minutes(int(seconds or 0) // 60)
+
+
 def ts_to_local(ts: int) -> str:
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-        return datetime.fromtimestamp(ts, tz=tz).strftime("%Y-%m-%d %H:%M")
-    except Exception:
-        return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+    return datetime.fromtimestamp(ts, tz=LOCAL_TZ).strftime("%Y-%m-%d %H:%M")
+
+
+# AFK_CHANNEL_IDS is fixed for the process lifetime, so the filter fragment
+# and its bind params are built once here instead of per command invocation.
+# NOT IN keeps the predicate planner-friendly however many channels are
+# excluded. Callers must not mutate the shared params list.
+_AFK_FILTER = (
+    (f" AND channel_id NOT IN ({','.join('?' * len(AFK_CHANNEL_IDS))}) ", list(AFK_CHANNEL_IDS))
+    if AFK_CHANNEL_IDS else (" ", [])
+)
 
 
 def afk_filter_clause():
-    if AFK_CHANNEL_ID:
-        return " AND channel_id != ? ", [AFK_CHANNEL_ID]
-    return " ", []
+    return _AFK_FILTER
 
 
-def aggregate_seconds_by_hour(rows, since_ts: int, now_ts_: int, tz_name: str, afk_channel_id: int | None):
-    """rows: list of (joined_ts, left_ts, channel_id). Returns [sec_per_hour_0..23]."""
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(tz_name)
-    except Exception:
-        tz = timezone.utc
-
-    buckets = [0] * 24
-    for joined_ts, left_ts, ch_id in rows:
-        if afk_channel_id and ch_id == afk_channel_id:
-            continue
-        start = max(joined_ts, since_ts)
-        end = min(left_ts or now_ts_, now_ts_)
-        if end <= start:
-            continue
-        cur = start
-        while cur < end:
-            cur_dt = datetime.fromtimestamp(cur, tz=tz)
-            next_hour = (cur_dt.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1))
-            boundary = min(int(next_hour.timestamp()), end)
-            buckets[cur_dt.hour] += boundary - cur
-            cur = boundary
-    return buckets
+async def fetch_hourly_seconds(since_ts: int, now: int, user_id: int | None = None):
+    """Seconds spent in voice per UTC hour bucket over [since_ts, now].
 
+    A recursive CTE walks every overlapping session forward one hour
+    boundary at a time, so the O(rows x hours) splitting runs inside
+    SQLite instead of allocating a tz-aware datetime per boundary in
+    Python. Returns rows (hour_epoch, seconds); callers fold the hour
+    epochs into local-time buckets (hour boundaries line up across
+    timezones with whole-hour offsets, and there are at most 24 per day
+    to convert).
+    """
+    extra, params = afk_filter_clause()
+    user_cond = " AND user_id = ?" if user_id is not None else ""
+    args = [since_ts, now, now, now, since_ts] + params
+    if user_id is not None:
+        args.append(user_id)
+    async with db() as cx:
+        async with cx.execute(f"""
+            WITH RECURSIVE spans(t, e) AS (
+                SELECT MAX(joined_ts, ?), MIN(COALESCE(left_ts, ?), ?)
+                FROM voice_sessions
+                WHERE joined_ts < ? AND (left_ts IS NULL OR left_ts > ?) {extra}{user_cond}
+                UNION ALL
+                SELECT (t / 3600 + 1) * 3600, e
+                FROM spans
+                WHERE (t / 3600 + 1) * 3600 < e
+            )
+            SELECT t / 3600 * 3600 AS hour_epoch,
+                   SUM(MIN(e, (t / 3600 + 1) * 3600) - t) AS secs
+            FROM spans
+            WHERE e > t
+            GROUP BY hour_epoch
+        """, args) as cur:
+            return await cur.fetchall()
+
+
+@lru_cache(maxsize=24 * 400)
+def _hour_info(hour_epoch: int) -> tuple[int, int, str, int]:
+    """(local hour of day, local weekday, local YYYY-MM-DD, local day
+    ordinal) for an hour-bucket epoch.
+
+    Bounded by distinct hours in the query window, so repeat charts hit
+    the cache instead of building a tz-aware datetime per bucket.
+    """
+    dt = datetime.fromtimestamp(hour_epoch, tz=LOCAL_TZ)
+    return dt.hour, dt.weekday(), dt.strftime("%Y-%m-%d"), dt.toordinal()
 
-def aggregate_seconds_by_weekday(rows, since_ts: int, now_ts_: int, tz_name: str, afk_channel_id: int | None):
-    """rows: list of (joined_ts, left_ts, channel_id). Returns [sec_per_day Mon..Sun]."""
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(tz_name)
-    except Exception:
-        tz = timezone.utc
-
-    buckets = [0] * 7
-    for joined_ts, left_ts, ch_id in rows:
-        if afk_channel_id and ch_id == afk_channel_id:
-            continue
-        start = max(joined_ts, since_ts)
-        end = min(left_ts or now_ts_, now_ts_)
-        if end <= start:
-            continue
-        cur = start
-        while cur < end:
-            cur_dt = datetime.fromtimestamp(cur, tz=tz)
-            next_day = (cur_dt.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1))
-            boundary = min(int(next_day.timestamp()), end)
-            buckets[cur_dt.weekday()] += boundary - cur
-            cur = boundary
-    return buckets
 
+def aggregate_seconds_by_day(rows, since_ts: int, now_ts_: int, afk_channel_ids: tuple[int, ...] | None):
+    """rows: list of (joined_ts, left_ts, channel_id). Returns dict {YYYY-MM-DD -> seconds}.
 
-def aggregate_seconds_by_day(rows, since_ts: int, now_ts_: int, tz_name: str, afk_channel_id: int | None):
-    """rows: list of (joined_ts, left_ts, channel_id). Returns dict {YYYY-MM-DD -> seconds}."""
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(tz_name)
-    except Exception:
-        tz = timezone.utc
-
-    buckets = {}
-    for joined_ts, left_ts, ch_id in rows:
-        if afk_channel_id and ch_id == afk_channel_id:
-            continue
-        start = max(joined_ts, since_ts)
-        end = min(left_ts or now_ts_, now_ts_)
-        if end <= start:
-            continue
-        cur = start
-        while cur < end:
-            cur_dt = datetime.fromtimestamp(cur, tz=tz)
-            next_midnight = (cur_dt.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1))
-            boundary = min(int(next_midnight.timestamp()), end)
-            day_key = cur_dt.strftime("%Y-%m-%d")
-            buckets[day_key] = buckets.get(day_key, 0) + (boundary - cur)
-            cur = boundary
+    Vectorized: sessions are exploded into per-hour segments with pure
+    int64 array arithmetic (no datetime per boundary), then the distinct
+    hour epochs — at most 24 per day — are folded into local days
+    through the cached hour-info lookup.
+    """
+    if not rows:
+        return {}
+    arr = np.asarray(
+        [(j, l or now_ts_, c) for j, l, c in rows], dtype=np.int64
+    )
+    joined, left, ch = arr[:, 0], arr[:, 1], arr[:, 2]
+    if afk_channel_ids:
+        keep = ~np.isin(ch, afk_channel_ids)
+        joined, left = joined[keep], left[keep]
+    start = np.maximum(joined, since_ts)
+    end = np.minimum(left, now_ts_)
+    valid = end > start
+    start, end = start[valid], end[valid]
+    if start.size == 0:
+        return {}
+
+    # Explode each session into the hour buckets it touches.
+    first_hour = start // 3600
+    counts = (end - 1) // 3600 - first_hour + 1
+    idx = np.repeat(np.arange(start.size), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    hour = first_hour[idx] + offset
+    span = (np.minimum((hour + 1) * 3600, end[idx])
+            - np.maximum(hour * 3600, start[idx]))
+
+    uniq, inv = np.unique(hour, return_inverse=True)
+    sums = np.bincount(inv, weights=span).astype(np.int64)
+    buckets: dict[str, int] = defaultdict(int)
+    for hour_epoch, secs in zip(uniq.tolist(), sums.tolist()):
+        buckets[_hour_info(hour_epoch * 3600)[2]] += secs
     return buckets
 
 
 async def fetch_sessions_window(since_ts: int):
     """Return rows (user_id, channel_id, joined_ts, left_ts) overlapping the window [since_ts, now]."""
     now = now_ts()
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             """
             SELECT user_id, channel_id, joined_ts, left_ts
             FROM voice_sessions
-            WHERE joined_ts < ? AND COALESCE(left_ts, strftime('%s','now')) > ?
+            WHERE joined_ts < ? AND (left_ts IS NULL OR left_ts > ?)
             """,
             (now, since_ts)
         ) as cur:
@@ -207,126 +470,137 @@ async def fetch_sessions_window(since_ts: int):
     return rows
 
 
-def aggregate_unique_users_by_day(rows, since_ts: int, tz_name: str, afk_channel_id: int | None):
+def aggregate_unique_users_by_day(rows, since_ts: int, afk_channel_ids: tuple[int, ...] | None):
     """rows: (user_id, channel_id, joined_ts, left_ts). Returns {YYYY-MM-DD: set(user_ids)}."""
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(tz_name)
-    except Exception:
-        tz = timezone.utc
-
-    day_users = {}
+    day_users: dict[str, set[int]] = defaultdict(set)
     now_ = now_ts()
     for user_id, ch_id, joined_ts, left_ts in rows:
-        if afk_channel_id and ch_id == afk_channel_id:
+        if afk_channel_ids and ch_id in afk_channel_ids:
             continue
         start = max(joined_ts, since_ts)
         end = min(left_ts or now_, now_)
         if end <= start:
             continue
-        cur = start
-        while cur < end:
-            cur_dt = datetime.fromtimestamp(cur, tz=tz)
-            next_midnight = (cur_dt.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1))
-            boundary = min(int(next_midnight.timestamp()), end)
-            day_key = cur_dt.strftime("%Y-%m-%d")
-            s = day_users.setdefault(day_key, set())
-            s.add(user_id)
-            cur = boundary
+        # Step over UTC hour epochs with plain integer math; the cached
+        # _hour_info lookup maps each hour to its local day key, so no
+        # tz-aware datetime is built per boundary.
+        for h in range(start // 3600, (end - 1) // 3600 + 1):
+            day_users[_hour_info(h * 3600)[2]].add(user_id)
     return day_users
 
 
-def peak_concurrency(rows, since_ts: int, tz_name: str, afk_channel_id: int | None):
+def peak_concurrency(rows, since_ts: int, afk_channel_ids: tuple[int, ...] | None):
     """Return overall peak count and per-day peaks {YYYY-MM-DD: peak}."""
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(tz_name)
-    except Exception:
-        tz = timezone.utc
-
     now_ = now_ts()
-    events = []
+    bounds = []
     for _uid, ch_id, joined_ts, left_ts in rows:
-        if afk_channel_id and ch_id == afk_channel_id:
+        if afk_channel_ids and ch_id in afk_channel_ids:
             continue
         start = max(joined_ts, since_ts)
         end = min(left_ts or now_, now_)
-        if end <= start:
-            continue
-        events.append((start, +1))
-        events.append((end, -1))
-    events.sort()
-
-    overall_peak = 0
-    cur = 0
-    per_day_peak = {}
-
-    for ts, delta in events:
-        cur += delta
-        if cur > overall_peak:
-            overall_peak = cur
-        day_key = datetime.fromtimestamp(ts, tz=tz).strftime("%Y-%m-%d")
-        if cur > per_day_peak.get(day_key, 0):
-            per_day_peak[day_key] = cur
-    return overall_peak, per_day_peak
-
-
-def solo_seconds_per_user(rows, since_ts: int, tz_name: str, afk_channel_id: int | None):
+        if end > start:
+            bounds.append((start, end))
+    if not bounds:
+        return 0, {}
+
+    b = np.asarray(bounds, dtype=np.int64)
+    n = len(b)
+    ts = np.concatenate([b[:, 0], b[:, 1]])
+    delta = np.concatenate([np.ones(n, np.int64), -np.ones(n, np.int64)])
+    # Single packed-key sort instead of a two-key lexsort: the timestamp in
+    # the high bits with a one-bit join/leave tag keeps leaves before joins
+    # at equal timestamps, like the old tuple sort, at flat-int sort cost.
+    order = np.argsort((ts.astype(np.uint64) << np.uint64(1)) | (delta > 0))
+    ts = ts[order]
+    occ = np.cumsum(delta[order])
+
+    # Fold event hours to local day ordinals through the cached lookup, then
+    # take the running-count maximum over each contiguous day run.
+    hours, inv = np.unique(ts // 3600 * 3600, return_inverse=True)
+    day_ords = np.asarray([_hour_info(int(h))[3] for h in hours], dtype=np.int64)[inv]
+    starts = np.flatnonzero(np.r_[True, day_ords[1:] != day_ords[:-1]])
+    peaks = np.maximum.reduceat(occ, starts)
+
+    per_day_peak = {
+        date.fromordinal(int(day_ords[i])).strftime("%Y-%m-%d"): int(p)
+        for i, p in zip(starts, peaks) if p > 0
+    }
+    return int(occ.max()), per_day_peak
+
+
+def solo_seconds_per_user(rows, since_ts: int, afk_channel_ids: tuple[int, ...] | None):
     """
     rows: list of (user_id, channel_id, joined_ts, left_ts) overlapping the window.
     Returns dict {user_id: solo_seconds} where 'solo' means channel occupancy == 1.
     """
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(tz_name)
-    except Exception:
-        tz = timezone.utc
-
     now_ = now_ts()
-    per_ch: dict[int, list[tuple[int, int, int]]] = {}
+    sessions = []
     for uid, ch_id, joined_ts, left_ts in rows:
-        if afk_channel_id and ch_id == afk_channel_id:
+        if afk_channel_ids and ch_id in afk_channel_ids:
             continue
         start = max(joined_ts, since_ts)
         end = min(left_ts or now_, now_)
-        if end <= start:
-            continue
-        per_ch.setdefault(ch_id, []).append((start, uid, +1))
-        per_ch[ch_id].append((end, uid, -1))
-
-    solo_totals: dict[int, int] = {}
-    for ch_id, events in per_ch.items():
-        events.sort(key=lambda x: (x[0], x[2]))
-        present: set[int] = set()
-        prev_t: int | None = None
-
-        for t, uid, delta in events:
-            if prev_t is not None and len(present) == 1:
-                only_uid = next(iter(present))
-                solo_totals[only_uid] = solo_totals.get(only_uid, 0) + (t - prev_t)
-            if delta == +1:
-                present.add(uid)
-            else:
-                present.discard(uid)
-            prev_t = t
-    return solo_totals
+        if end > start:
+            sessions.append((ch_id, uid, start, end))
+    sessions.sort()
+
+    # Merge overlapping sessions of the same user in the same channel (stale
+    # rows after a crash can overlap) so occupancy below counts distinct
+    # users, matching the old set-based sweep.
+    data = []
+    last_key = None
+    last_end = 0
+    for ch_id, uid, start, end in sessions:
+        key = (ch_id, uid)
+        if key == last_key:
+            if start < last_end:
+                start = last_end
+            if end <= start:
+                continue
+        data.append((ch_id, start, uid, 1))
+        data.append((ch_id, end, uid, -1))
+        last_key = key
+        last_end = end
+    if not data:
+        return {}
+
+    ev = np.asarray(data, dtype=np.int64)
+    # Pack (channel, ts, join/leave) into one uint64 sort key — channel ids
+    # are compacted first since a raw snowflake would not fit above the
+    # 34 bits the timestamp needs.
+    ch_idx = np.unique(ev[:, 0], return_inverse=True)[1].astype(np.uint64)
+    key = ((ch_idx << np.uint64(35))
+           | (ev[:, 1].astype(np.uint64) << np.uint64(1))
+           | (ev[:, 3] > 0))
+    order = np.argsort(key)
+    ch, ts, uid, delta = ev[order].T
+
+    # Every session contributes both its +1 and -1 within its channel
+    # segment, so the running sums return to zero at each channel boundary
+    # and one global cumsum is per-channel correct without resets.
+    # Compact user indices (not raw snowflakes, which would overflow int64
+    # when summed) make the id-cumsum equal the lone occupant's index + 1
+    # exactly where occupancy == 1.
+    users, uidx = np.unique(uid, return_inverse=True)
+    occ = np.cumsum(delta)
+    id_sum = np.cumsum((uidx + 1) * delta)
+
+    mask = (occ[:-1] == 1) & (ch[1:] == ch[:-1])
+    spans = (ts[1:] - ts[:-1])[mask]
+    active = id_sum[:-1][mask] - 1
+    totals = np.bincount(active, weights=spans, minlength=len(users)).astype(np.int64)
+    return {int(u): int(t) for u, t in zip(users, totals) if t}
 
 
 def aggregate_night_seconds_per_user(
-    rows, since_ts: int, now_ts_: int, tz_name: str,
-    afk_channel_id: int | None, start_hour: int, end_hour: int
+    rows, since_ts: int, now_ts_: int,
+    afk_channel_ids: tuple[int, ...] | None, start_hour: int, end_hour: int
 ) -> dict[int, int]:
     """
     rows: (user_id, channel_id, joined_ts, left_ts).
     Returns {user_id: seconds} counting only time within [start_hour, end_hour).
     Handles midnight wraparound (e.g. start=23, end=4 covers 23:00–04:00).
     """
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(tz_name)
-    except Exception:
-        tz = timezone.utc
-
     def in_window(h: int) -> bool:
         if start_hour < end_hour:
             return start_hour <= h < end_hour
@@ -336,7 +610,7 @@ def aggregate_night_seconds_per_user(
 
     user_secs: dict[int, int] = defaultdict(int)
     for uid, ch_id, joined_ts, left_ts in rows:
-        if afk_channel_id and ch_id == afk_channel_id:
+        if afk_channel_ids and ch_id in afk_channel_ids:
             continue
         start = max(joined_ts, since_ts)
         end = min(left_ts or now_ts_, now_ts_)
@@ -344,15 +618,78 @@ def aggregate_night_seconds_per_user(
             continue
         cur = start
         while cur < end:
-            cur_dt = datetime.fromtimestamp(cur, tz=tz)
-            next_hour = cur_dt.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-            boundary = min(int(next_hour.timestamp()), end)
-            if in_window(cur_dt.hour):
+            hour_epoch = cur // 3600 * 3600
+            boundary = min(hour_epoch + 3600, end)
+            if in_window(_hour_info(hour_epoch)[0]):
                 user_secs[uid] += boundary - cur
             cur = boundary
     return dict(user_secs)
 
 
+# -------- Member labels --------
+# Cross-command cache for names that had to be fetched over HTTP (members
+# no longer in the local cache, usually departed). Keyed (guild_id, user_id)
+# with a TTL so renames eventually show; bounded LRU so it cannot grow with
+# server history. Members resolvable via get_member never go through here,
+# so live display names stay fresh.
+_member_names: OrderedDict[tuple[int, int], tuple[int, str]] = OrderedDict()
+_MEMBER_NAMES_MAX = 2048
+_MEMBER_NAME_TTL = 6 * 3600
+
+
+def member_labeler(guild: discord.Guild):
+    """
+    Returns an async label_for(uid) with a per-invocation cache of escaped
+    display names. Every leaderboard command used to carry its own copy of
+    this closure; sharing one keeps the cache behaviour (and the fetch_member
+    fallback for departed members) identical everywhere.
+    """
+    cache: dict[int, str] = {}
+
+    async def label_for(uid: int) -> str:
+        if uid in cache:
+            return cache[uid]
+        m = guild.get_member(uid)
+        if m is None:
+            key = (guild.id, uid)
+            hit = _member_names.get(key)
+            if hit is not None and hit[0] > now_ts():
+                _member_names.move_to_end(key)
+                cache[uid] = hit[1]
+                return hit[1]
+            try:
+                m = await guild.fetch_member(uid)
+                name = escape_markdown(m.display_name)
+            except (NotFound, Forbidden, Exception):
+                name = f"User {uid}"
+            _member_names[key] = (now_ts() + _MEMBER_NAME_TTL, name)
+            _member_names.move_to_end(key)
+            while len(_member_names) > _MEMBER_NAMES_MAX:
+                _member_names.popitem(last=False)
+            cache[uid] = name
+            return name
+        name = escape_markdown(m.display_name)
+        cache[uid] = name
+        return name
+
+    async def prefetch(uids) -> None:
+        """Warm the member cache for many uids with one gateway request.
+
+        query_members resolves up to 100 ids per call, so a leaderboard of
+        cache misses costs one round-trip instead of one fetch_member each.
+        Failures are ignored; label_for falls back per user.
+        """
+        missing = [uid for uid in uids if uid not in cache and guild.get_member(uid) is None]
+        for i in range(0, len(missing), 100):
+            try:
+                await guild.query_members(user_ids=missing[i:i + 100], cache=True)
+            except Exception:
+                return
+
+    label_for.prefetch = prefetch
+    return label_for
+
+
 # -------- Admin guard --------
 async def admin_guard(inter: discord.Interaction) -> bool:
     """
@@ -370,21 +707,38 @@ async def admin_guard(inter: discord.Interaction) -> bool:
 
 
 # -------- Stat helpers --------
+async def sum_user_voice_seconds(cx, user_id: int, since_ts: int = 0, now: int | None = None) -> int:
+    """
+    Total voice seconds for one user since since_ts: closed sessions summed
+    from the generated duration column (covering-index scan), plus the live
+    remainder of any still-open session.
+    """
+    now = now if now is not None else now_ts()
+    extra, params = afk_filter_clause()
+    async with cx.execute(
+        f"SELECT SUM(duration) FROM voice_sessions "
+        f"WHERE user_id=? AND joined_ts>=? AND left_ts IS NOT NULL{extra}",
+        [user_id, since_ts] + params
+    ) as cur:
+        closed = (await cur.fetchone())[0] or 0
+    async with cx.execute(
+        f"SELECT SUM(? - joined_ts) FROM voice_sessions "
+        f"WHERE user_id=? AND joined_ts>=? AND left_ts IS NULL{extra}",
+        [now, user_id, since_ts] + params
+    ) as cur:
+        open_secs = (await cur.fetchone())[0] or 0
+    return closed + open_secs
+
+
 async def compute_streak(user_id: int) -> int:
     """Return the current consecutive-day streak (days with any non-AFK voice activity)."""
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
+    tz = LOCAL_TZ
 
     now = now_ts()
-    afk_cond = " AND channel_id != ?" if AFK_CHANNEL_ID else ""
-    params: list = [now, user_id]
-    if AFK_CHANNEL_ID:
-        params.append(AFK_CHANNEL_ID)
+    afk_cond, afk_params = afk_filter_clause()
+    params: list = [now, user_id] + afk_params
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             f"SELECT joined_ts, COALESCE(left_ts, ?) FROM voice_sessions WHERE user_id=?{afk_cond}",
             params
@@ -413,13 +767,14 @@ async def compute_streak(user_id: int) -> int:
 
 async def compute_rank(user_id: int) -> tuple[int, int]:
     """Returns (rank, total_active_users) sorted by all-time voice time."""
+    now = now_ts()
     extra, params = afk_filter_clause()
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             f"SELECT user_id FROM voice_sessions WHERE 1=1{extra} "
             f"GROUP BY user_id "
-            f"ORDER BY SUM(COALESCE(left_ts, strftime('%s','now')) - joined_ts) DESC",
-            params
+            f"ORDER BY SUM(COALESCE(duration, ? - joined_ts)) DESC",
+            params + [now]
         ) as cur:
             rows = await cur.fetchall()
     uids = [r[0] for r in rows]
@@ -431,7 +786,7 @@ async def compute_rank(user_id: int) -> tuple[int, int]:
 async def compute_together_seconds(user1_id: int, user2_id: int) -> int:
     """Total seconds user1 and user2 spent in the same voice channel simultaneously."""
     now = now_ts()
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             "SELECT channel_id, joined_ts, COALESCE(left_ts, ?) FROM voice_sessions WHERE user_id=?",
             (now, user1_id)
@@ -469,19 +824,19 @@ async def compute_all_pairs(since_ts: int | None = None) -> dict[tuple[int, int]
     now = now_ts()
     since_ts = since_ts or 0
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             """SELECT user_id, channel_id, joined_ts, COALESCE(left_ts, ?)
                FROM voice_sessions
-               WHERE COALESCE(left_ts, ?) > ?""",
-            (now, now, since_ts)
+               WHERE left_ts IS NULL OR left_ts > ?""",
+            (now, since_ts)
         ) as cur:
             rows = await cur.fetchall()
 
     # Group sessions by channel, clamping to window
     by_ch: dict[int, list[tuple[int, int, int]]] = defaultdict(list)
     for uid, ch_id, s, e in rows:
-        if AFK_CHANNEL_ID and ch_id == AFK_CHANNEL_ID:
+        if ch_id in AFK_CHANNEL_IDS:
             continue
         by_ch[ch_id].append((uid, max(s, since_ts), e))
 
@@ -510,19 +865,19 @@ async def compute_together_all(user_id: int, since_ts: int | None = None) -> dic
     now = now_ts()
     since_ts = since_ts or 0
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             """SELECT channel_id, joined_ts, COALESCE(left_ts, ?)
                FROM voice_sessions
-               WHERE user_id=? AND COALESCE(left_ts, ?) > ?""",
-            (now, user_id, now, since_ts)
+               WHERE user_id=? AND (left_ts IS NULL OR left_ts > ?)""",
+            (now, user_id, since_ts)
         ) as cur:
             my_sessions = await cur.fetchall()
         async with cx.execute(
             """SELECT user_id, channel_id, joined_ts, COALESCE(left_ts, ?)
                FROM voice_sessions
-               WHERE user_id != ? AND COALESCE(left_ts, ?) > ?""",
-            (now, user_id, now, since_ts)
+               WHERE user_id != ? AND (left_ts IS NULL OR left_ts > ?)""",
+            (now, user_id, since_ts)
         ) as cur:
             all_sessions = await cur.fetchall()
 
@@ -542,6 +897,25 @@ async def compute_together_all(user_id: int, since_ts: int | None = None) -> dic
     return dict(together)
 
 
+# -------- Open-session tracking --------
+# Maps (user_id, channel_id) -> voice_sessions.id for sessions we opened in
+# this process, so closing one is a primary-key UPDATE instead of a
+# partial-index lookup in the SQLite worker thread.
+_open_sessions: dict[tuple[int, int], int] = {}
+
+
+def _close_session_where(user_id: int, channel_id: int) -> tuple[str, list]:
+    """
+    WHERE fragment (and params) for closing this member's open session.
+    PK lookup when we tracked the row id at join time; falls back to the
+    partial-index path for sessions that predate this process.
+    """
+    sess_id = _open_sessions.pop((user_id, channel_id), None)
+    if sess_id is not None:
+        return "id=? AND left_ts IS NULL", [sess_id]
+    return "user_id=? AND channel_id=? AND left_ts IS NULL", [user_id, channel_id]
+
+
 # -------- Shutdown & reconciliation --------
 async def close_open_sessions():
     """
@@ -550,14 +924,19 @@ async def close_open_sessions():
     doesn't leave orphaned sessions that accumulate time forever.
     """
     now = now_ts()
-    async with aiosqlite.connect(DB_PATH) as cx:
-        result = await cx.execute(
-            "UPDATE voice_sessions SET left_ts=? WHERE left_ts IS NULL", (now,)
-        )
+    async with db_write() as cx:
+        async with cx.execute(
+            "UPDATE voice_sessions SET left_ts=? WHERE left_ts IS NULL "
+            "RETURNING user_id, channel_id, joined_ts",
+            (now,)
+        ) as cur:
+            closed = await cur.fetchall()
+        for user_id, channel_id, joined_ts in closed:
+            await record_closed_session(cx, user_id, channel_id, joined_ts, now)
         await cx.commit()
-        count = result.rowcount
-    if count:
-        print(f"🔒 Closed {count} open session(s) on shutdown.")
+    _open_sessions.clear()
+    if closed:
+        _log.info(f"🔒 Closed {len(closed)} open session(s) on shutdown.")
 
 
 async def reconcile_open_sessions(guild: discord.Guild):
@@ -573,7 +952,7 @@ async def reconcile_open_sessions(guild: discord.Guild):
     now = now_ts()
     max_secs = MAX_SESSION_HOURS * 3600
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             "SELECT id, user_id, channel_id, joined_ts FROM voice_sessions WHERE left_ts IS NULL"
         ) as cur:
@@ -582,7 +961,7 @@ async def reconcile_open_sessions(guild: discord.Guild):
     if not orphans:
         return
 
-    print(f"🔧 Reconciling {len(orphans)} orphaned session(s) from before restart...")
+    _log.info(f"🔧 Reconciling {len(orphans)} orphaned session(s) from before restart...")
 
     # Map (user_id, channel_id) → True for everyone currently in voice
     live: set[tuple[int, int]] = set()
@@ -590,43 +969,47 @@ async def reconcile_open_sessions(guild: discord.Guild):
         for m in vc.members:
             live.add((m.id, vc.id))
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db_write() as cx:
         for sess_id, user_id, channel_id, joined_ts in orphans:
             if (user_id, channel_id) in live:
                 # Still in voice: close the gap-infected row, open a fresh one
                 await cx.execute(
                     "UPDATE voice_sessions SET left_ts=? WHERE id=?", (now, sess_id)
                 )
-                await cx.execute(
+                await record_closed_session(cx, user_id, channel_id, joined_ts, now)
+                cur = await cx.execute(
                     "INSERT INTO voice_sessions(user_id, channel_id, joined_ts) VALUES(?,?,?)",
                     (user_id, channel_id, now)
                 )
-                print(f"  ↻ uid={user_id} still in vc={channel_id}: session reset")
+                _open_sessions[(user_id, channel_id)] = cur.lastrowid
+                _log.info(f"  ↻ uid={user_id} still in vc={channel_id}: session reset")
             else:
                 # Left while bot was down: cap to MAX_SESSION_HOURS
                 capped = min(now, joined_ts + max_secs)
                 await cx.execute(
                     "UPDATE voice_sessions SET left_ts=? WHERE id=?", (capped, sess_id)
                 )
-                print(
+                await record_closed_session(cx, user_id, channel_id, joined_ts, capped)
+                _log.info(
                     f"  ✂ uid={user_id} left vc={channel_id} while offline: "
                     f"capped at {fmt_duration(capped - joined_ts)}"
                 )
         await cx.commit()
 
-    print("✅ Session reconciliation complete.")
+    _log.info("✅ Session reconciliation complete.")
 
 
 async def graceful_shutdown():
     """Flush open sessions then close the Discord client."""
-    print("⚠️  Shutdown signal received — flushing open sessions...")
+    _log.warning("Shutdown signal received — flushing open sessions...")
     await close_open_sessions()
+    await close_db()
     await client.close()
 
 
 # -------- DB --------
 async def ensure_schema():
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db_write() as cx:
         await cx.executescript("""
         PRAGMA journal_mode = WAL;
         CREATE TABLE IF NOT EXISTS voice_sessions (
@@ -642,12 +1025,101 @@ async def ensure_schema():
           awarded_ts INTEGER NOT NULL,
           PRIMARY KEY (user_id, hours)
         );
-        CREATE INDEX IF NOT EXISTS idx_voice_open ON voice_sessions(user_id) WHERE left_ts IS NULL;
-        CREATE INDEX IF NOT EXISTS idx_voice_join ON voice_sessions(joined_ts);
+        CREATE TABLE IF NOT EXISTS voice_daily_totals (
+          user_id    INTEGER NOT NULL,
+          channel_id INTEGER NOT NULL,
+          day        INTEGER NOT NULL,   -- unix epoch day (UTC)
+          seconds    INTEGER NOT NULL,
+          PRIMARY KEY (user_id, channel_id, day)
+        );
+        """)
+
+        # Generated column: duration of a *closed* session (NULL while open).
+        # Lets aggregates SUM(duration) directly instead of recomputing
+        # COALESCE(left_ts, now) - joined_ts per row. Added via ALTER so older
+        # databases pick it up; SQLite only allows adding VIRTUAL generated
+        # columns through ALTER TABLE, which is fine — they can still be indexed.
+        async with cx.execute(
+            "SELECT COUNT(*) FROM pragma_table_xinfo('voice_sessions') WHERE name='duration'"
+        ) as cur:
+            has_duration = (await cur.fetchone())[0]
+        if not has_duration:
+            await cx.execute(
+                "ALTER TABLE voice_sessions ADD COLUMN duration INTEGER "
+                "GENERATED ALWAYS AS (left_ts - joined_ts) VIRTUAL"
+            )
+            # Recreate the covering index so it includes the new column.
+            await cx.execute("DROP INDEX IF EXISTS idx_voice_user_join")
+
+        await cx.executescript("""
+        -- Open-session lookups (close path fallback, shutdown sweep, open-time
+        -- corrections) read user/channel/joined straight from this index.
+        DROP INDEX IF EXISTS idx_voice_open;
+        CREATE INDEX IF NOT EXISTS idx_voice_open2
+          ON voice_sessions(user_id, channel_id, joined_ts) WHERE left_ts IS NULL;
+        -- idx_voice_join(joined_ts) is subsumed by idx_voice_join_user below.
+        DROP INDEX IF EXISTS idx_voice_join;
+        -- Covering composite indexes: the per-user and per-window scans read
+        -- every column they need from the index (index-only scans), so the
+        -- wider table rows never leave the SD card.
+        CREATE INDEX IF NOT EXISTS idx_voice_user_join
+          ON voice_sessions(user_id, joined_ts, channel_id, left_ts, duration);
+        CREATE INDEX IF NOT EXISTS idx_voice_join_user
+          ON voice_sessions(joined_ts, user_id, channel_id, left_ts);
+        CREATE INDEX IF NOT EXISTS idx_rollup_day
+          ON voice_daily_totals(day, channel_id, user_id, seconds);
+        -- Serves the left_ts > ? branch of the window-overlap predicate;
+        -- the left_ts IS NULL branch is covered by idx_voice_open2.
+        CREATE INDEX IF NOT EXISTS idx_voice_left
+          ON voice_sessions(left_ts) WHERE left_ts IS NOT NULL;
         """)
+
+        # One-time backfill for databases that predate the rollup table.
+        async with cx.execute("SELECT COUNT(*) FROM voice_daily_totals") as cur:
+            have_rollup = (await cur.fetchone())[0]
+        if not have_rollup:
+            async with cx.execute(
+                "SELECT user_id, channel_id, joined_ts, left_ts "
+                "FROM voice_sessions WHERE left_ts IS NOT NULL"
+            ) as cur:
+                closed = await cur.fetchall()
+            for user_id, channel_id, joined_ts, left_ts in closed:
+                await record_closed_session(cx, user_id, channel_id, joined_ts, left_ts)
+            if closed:
+                _log.info(f"📊 Backfilled voice_daily_totals from {len(closed)} closed session(s).")
+
+        # Refresh planner statistics so the composite indexes actually get picked.
+        await cx.execute("ANALYZE")
         await cx.commit()
 
 
+# -------- Daily rollup --------
+# voice_daily_totals pre-aggregates closed sessions into per-user,
+# per-channel, per-day buckets, so total/leaderboard queries scan a handful
+# of rollup rows instead of the full session history. Open sessions are not
+# in the rollup; readers add a small correction from voice_sessions using
+# the partial index on left_ts IS NULL.
+def split_session_days(joined_ts: int, left_ts: int) -> list[tuple[int, int]]:
+    """Split [joined_ts, left_ts) into (epoch_day, seconds) chunks at UTC midnights."""
+    chunks = []
+    cur = joined_ts
+    while cur < left_ts:
+        day = cur // 86400
+        boundary = min((day + 1) * 86400, left_ts)
+        chunks.append((day, boundary - cur))
+        cur = boundary
+    return chunks
+
+
+async def record_closed_session(cx, user_id: int, channel_id: int, joined_ts: int, left_ts: int):
+    """Fold a just-closed session into the voice_daily_totals rollup."""
+    await cx.executemany(
+        "INSERT INTO voice_daily_totals(user_id, channel_id, day, seconds) VALUES(?,?,?,?) "
+        "ON CONFLICT(user_id, channel_id, day) DO UPDATE SET seconds = seconds + excluded.seconds",
+        [(user_id, channel_id, day, secs) for day, secs in split_session_days(joined_ts, left_ts)]
+    )
+
+
 # -------- Background tasks --------
 @tasks.loop(seconds=60)
 async def milestone_check():
@@ -666,32 +1138,26 @@ async def milestone_check():
         return
 
     now = now_ts()
-    extra, afk_params = afk_filter_clause()
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             "SELECT user_id, channel_id FROM voice_sessions WHERE left_ts IS NULL"
         ) as cur:
             active = await cur.fetchall()
 
     for user_id, channel_id in active:
-        if AFK_CHANNEL_ID and channel_id == AFK_CHANNEL_ID:
+        if channel_id in AFK_CHANNEL_IDS:
             continue
 
         # Cumulative total including the ongoing session
-        async with aiosqlite.connect(DB_PATH) as cx:
-            async with cx.execute(
-                f"SELECT SUM(COALESCE(left_ts, ?) - joined_ts) FROM voice_sessions WHERE user_id=?{extra}",
-                [now, user_id] + afk_params
-            ) as cur:
-                row = await cur.fetchone()
+        async with db() as cx:
+            total_seconds = await sum_user_voice_seconds(cx, user_id, now=now)
 
-        total_seconds = row[0] or 0
         total_hours = total_seconds / 3600
 
         for threshold in MILESTONE_HOURS:
             if total_hours >= threshold:
-                async with aiosqlite.connect(DB_PATH) as cx:
+                async with db_write() as cx:
                     ins = await cx.execute(
                         "INSERT OR IGNORE INTO milestones(user_id, hours, awarded_ts) VALUES(?,?,?)",
                         (user_id, threshold, now)
@@ -712,11 +1178,7 @@ async def _build_and_send_recap(guild: discord.Guild, channel, month_override: s
     and the manual /voice_recap command can call it.
     month_override: optional 'YYYY-MM' string to recap a specific past month.
     """
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
+    tz = LOCAL_TZ
 
     now_local = datetime.now(tz)
 
@@ -739,21 +1201,21 @@ async def _build_and_send_recap(guild: discord.Guild, channel, month_override: s
     until = int(first_this_month.timestamp())
     month_label = first_last_month.strftime("%B %Y")
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             """
             SELECT user_id, channel_id, joined_ts, left_ts
             FROM voice_sessions
-            WHERE joined_ts < ? AND COALESCE(left_ts, ?) > ?
+            WHERE joined_ts < ? AND (left_ts IS NULL OR left_ts > ?)
             """,
-            (until, until, since)
+            (until, since)
         ) as cur:
             rows = await cur.fetchall()
 
     user_secs: dict[int, int] = defaultdict(int)
     total_secs = 0
     for uid, ch_id, joined_ts, left_ts in rows:
-        if AFK_CHANNEL_ID and ch_id == AFK_CHANNEL_ID:
+        if ch_id in AFK_CHANNEL_IDS:
             continue
         start = max(joined_ts, since)
         end = min(left_ts or until, until)
@@ -763,11 +1225,13 @@ async def _build_and_send_recap(guild: discord.Guild, channel, month_override: s
             total_secs += dur
 
     day_rows = [(joined_ts, left_ts, ch_id) for _, ch_id, joined_ts, left_ts in rows]
-    day_buckets = aggregate_seconds_by_day(day_rows, since, until, TZ_NAME, AFK_CHANNEL_ID or None)
+    day_buckets = await asyncio.to_thread(
+        aggregate_seconds_by_day, day_rows, since, until, AFK_CHANNEL_IDS or None
+    )
     best_day = max(day_buckets, key=day_buckets.get) if day_buckets else None
     best_day_str = f"{best_day} ({fmt_duration(day_buckets[best_day])})" if best_day else "N/A"
 
-    overall_peak, _ = peak_concurrency(rows, since, TZ_NAME, AFK_CHANNEL_ID or None)
+    overall_peak, _ = await asyncio.to_thread(peak_concurrency, rows, since, AFK_CHANNEL_IDS or None)
     unique_count = len(user_secs)
 
     medals = ["🥇", "🥈", "🥉", "4.", "5."]
@@ -791,7 +1255,7 @@ async def _build_and_send_recap(guild: discord.Guild, channel, month_override: s
     embed.set_footer(text=f"{guild.name} • Generated on {datetime.now(tz).strftime('%d %b %Y')}")
 
     await channel.send(embed=embed)
-    print(f"✅ Monthly recap posted for {month_label}")
+    _log.info(f"✅ Monthly recap posted for {month_label}")
 
 
 _last_recapped_month: str | None = None  # "YYYY-MM" of the last auto-posted recap
@@ -804,11 +1268,7 @@ async def monthly_recap():
     global _last_recapped_month
     if not GUILD_ID or not BOT_CHANNEL:
         return
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
+    tz = LOCAL_TZ
 
     now_local = datetime.now(tz)
     if now_local.day != 1:
@@ -820,11 +1280,11 @@ async def monthly_recap():
 
     guild = client.get_guild(int(GUILD_ID))
     if not guild:
-        print("⚠️  monthly_recap: guild not found")
+        _log.warning("monthly_recap: guild not found")
         return
     channel = guild.get_channel(BOT_CHANNEL)
     if not channel:
-        print(f"⚠️  monthly_recap: BOT_CHANNEL {BOT_CHANNEL} not found")
+        _log.warning(f"monthly_recap: BOT_CHANNEL {BOT_CHANNEL} not found")
         return
 
     await _build_and_send_recap(guild, channel)
@@ -833,7 +1293,7 @@ async def monthly_recap():
 
 @monthly_recap.error
 async def monthly_recap_error(error: Exception):
-    print(f"❌ monthly_recap task crashed: {error!r} — restarting task")
+    _log.error(f"monthly_recap task crashed: {error!r} — restarting task")
     if not monthly_recap.is_running():
         monthly_recap.start()
 
@@ -848,21 +1308,22 @@ async def _assign_weekly_top_role(guild: discord.Guild) -> str:
     if role is None:
         return f"⚠️ Role {WEEKLY_TOP_ROLE_ID} not found in guild."
 
-    since = now_ts() - 7 * 86400
+    now = now_ts()
+    since = now - 7 * 86400
     extra, params = afk_filter_clause()
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(f"""
             SELECT user_id,
-                   SUM(COALESCE(left_ts, strftime('%s','now')) - joined_ts) AS total
+                   SUM(COALESCE(duration, ? - joined_ts)) AS total
             FROM voice_sessions
-            WHERE joined_ts < strftime('%s','now')
-              AND COALESCE(left_ts, strftime('%s','now')) > ?
+            WHERE joined_ts < ?
+              AND (left_ts IS NULL OR left_ts > ?)
               {extra}
             GROUP BY user_id
             ORDER BY total DESC
             LIMIT 5
-        """, [since] + params) as cur:
+        """, [now, now, since] + params) as cur:
             rows = await cur.fetchall()
 
     top_ids = {uid for uid, _ in rows}
@@ -911,11 +1372,7 @@ async def weekly_top_role():
     """Every Monday, assign WEEKLY_TOP_ROLE_ID to the top 5 voice users of the past 7 days."""
     if not GUILD_ID:
         return
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
+    tz = LOCAL_TZ
 
     now_local = datetime.now(tz)
     if now_local.weekday() != 0:  # 0 = Monday
@@ -923,24 +1380,41 @@ async def weekly_top_role():
 
     guild = client.get_guild(int(GUILD_ID))
     if not guild:
-        print("⚠️  weekly_top_role: guild not found")
+        _log.warning("weekly_top_role: guild not found")
         return
 
     result = await _assign_weekly_top_role(guild)
-    print(f"📅 weekly_top_role: {result}")
+    _log.info(f"📅 weekly_top_role: {result}")
 
 
 @weekly_top_role.error
 async def weekly_top_role_error(error: Exception):
-    print(f"❌ weekly_top_role task crashed: {error!r} — restarting task")
+    _log.error(f"weekly_top_role task crashed: {error!r} — restarting task")
     if not weekly_top_role.is_running():
         weekly_top_role.start()
 
 
+@tasks.loop(hours=24)
+async def db_maintenance():
+    """Keep planner statistics fresh and the WAL file from growing unbounded."""
+    async with db_write() as cx:
+        await cx.execute("ANALYZE")
+        await cx.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        await cx.commit()
+    _log.info("🧰 db_maintenance: ANALYZE + WAL checkpoint done")
+
+
+@db_maintenance.error
+async def db_maintenance_error(error: Exception):
+    _log.error(f"db_maintenance task crashed: {error!r} — restarting task")
+    if not db_maintenance.is_running():
+        db_maintenance.start()
+
+
 # -------- Startup --------
 @client.event
 async def setup_hook():
-    print("DEBUG pre-sync commands:", [c.name for c in tree.get_commands(guild=GUILD_OBJ)])
+    _log.debug("pre-sync commands: %s", [c.name for c in tree.get_commands(guild=GUILD_OBJ)])
 
 
 @client.event
@@ -963,14 +1437,14 @@ async def on_ready():
     try:
         if GUILD_OBJ:
             await tree.sync(guild=GUILD_OBJ)
-            print(f"✅ Synced slash commands to guild {GUILD_ID}")
+            _log.info(f"✅ Synced slash commands to guild {GUILD_ID}")
             await tree.sync()  # clear any stale global commands
-            print("🧹 Cleared global commands.")
+            _log.info("🧹 Cleared global commands.")
         else:
             synced = await tree.sync()
-            print(f"✅ Synced {len(synced)} global slash commands")
+            _log.info(f"✅ Synced {len(synced)} global slash commands")
     except Exception as e:
-        print(f"❌ Slash command sync failed: {e}")
+        _log.error(f"Slash command sync failed: {e}")
 
     # Start background tasks
     if not milestone_check.is_running():
@@ -979,8 +1453,10 @@ async def on_ready():
         monthly_recap.start()
     if not weekly_top_role.is_running():
         weekly_top_role.start()
+    if not db_maintenance.is_running():
+        db_maintenance.start()
 
-    print(f"Bot online as {client.user}")
+    _log.info(f"Bot online as {client.user}")
 
 
 # -------- Voice tracking --------
@@ -988,30 +1464,45 @@ async def on_ready():
 async def on_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
     now = now_ts()
     if before.channel is None and after.channel is not None:
-        async with aiosqlite.connect(DB_PATH) as cx:
-            await cx.execute(
+        async with db_write() as cx:
+            cur = await cx.execute(
                 "INSERT INTO voice_sessions(user_id, channel_id, joined_ts) VALUES(?,?,?)",
                 (member.id, after.channel.id, now)
             )
-            await cx.commit()
+            _open_sessions[(member.id, after.channel.id)] = cur.lastrowid
+            await commit_soon(cx)
     elif before.channel is not None and after.channel is None:
-        async with aiosqlite.connect(DB_PATH) as cx:
-            await cx.execute(
-                "UPDATE voice_sessions SET left_ts=? WHERE user_id=? AND channel_id=? AND left_ts IS NULL",
-                (now, member.id, before.channel.id)
-            )
-            await cx.commit()
+        async with db_write() as cx:
+            where, args = _close_session_where(member.id, before.channel.id)
+            async with cx.execute(
+                f"UPDATE voice_sessions SET left_ts=? WHERE {where} RETURNING joined_ts",
+                [now] + args
+            ) as cur:
+                closed = await cur.fetchall()
+            for (joined_ts,) in closed:
+                await record_closed_session(cx, member.id, before.channel.id, joined_ts, now)
+            await commit_soon(cx)
     elif before.channel and after.channel and before.channel.id != after.channel.id:
-        async with aiosqlite.connect(DB_PATH) as cx:
-            await cx.execute(
-                "UPDATE voice_sessions SET left_ts=? WHERE user_id=? AND channel_id=? AND left_ts IS NULL",
-                (now, member.id, before.channel.id)
-            )
-            await cx.execute(
+        async with db_write() as cx:
+            # Close the old session and open the new one under one explicit
+            # transaction: a single commit/fsync instead of two implicit ones.
+            # (Skip BEGIN when a debounced transaction is already open.)
+            if not cx.in_transaction:
+                await cx.execute("BEGIN IMMEDIATE")
+            where, args = _close_session_where(member.id, before.channel.id)
+            async with cx.execute(
+                f"UPDATE voice_sessions SET left_ts=? WHERE {where} RETURNING joined_ts",
+                [now] + args
+            ) as cur:
+                closed = await cur.fetchall()
+            for (joined_ts,) in closed:
+                await record_closed_session(cx, member.id, before.channel.id, joined_ts, now)
+            cur = await cx.execute(
                 "INSERT INTO voice_sessions(user_id, channel_id, joined_ts) VALUES(?,?,?)",
                 (member.id, after.channel.id, now)
             )
-            await cx.commit()
+            _open_sessions[(member.id, after.channel.id)] = cur.lastrowid
+            await commit_soon(cx)
 
 
 # -------- Slash commands --------
@@ -1096,33 +1587,13 @@ async def voice_me(inter: discord.Interaction):
 
     now = now_ts()
     uid = inter.user.id
-    extra, params = afk_filter_clause()
-
-    async with aiosqlite.connect(DB_PATH) as cx:
-        # Lifetime total
-        async with cx.execute(
-            f"SELECT SUM(COALESCE(left_ts, ?) - joined_ts) FROM voice_sessions WHERE user_id=?{extra}",
-            [now, uid] + params
-        ) as cur:
-            lifetime = (await cur.fetchone())[0] or 0
+    since_7 = now - 7 * 86400
+    since_30 = now - 30 * 86400
 
-        # Last 7 days
-        since_7 = now - 7 * 86400
-        async with cx.execute(
-            f"SELECT SUM(COALESCE(left_ts, ?) - joined_ts) FROM voice_sessions "
-            f"WHERE user_id=? AND joined_ts >= ?{extra}",
-            [now, uid, since_7] + params
-        ) as cur:
-            last7 = (await cur.fetchone())[0] or 0
-
-        # Last 30 days
-        since_30 = now - 30 * 86400
-        async with cx.execute(
-            f"SELECT SUM(COALESCE(left_ts, ?) - joined_ts) FROM voice_sessions "
-            f"WHERE user_id=? AND joined_ts >= ?{extra}",
-            [now, uid, since_30] + params
-        ) as cur:
-            last30 = (await cur.fetchone())[0] or 0
+    async with db() as cx:
+        lifetime = await sum_user_voice_seconds(cx, uid, now=now)
+        last7 = await sum_user_voice_seconds(cx, uid, since_7, now=now)
+        last30 = await sum_user_voice_seconds(cx, uid, since_30, now=now)
 
     rank, total_users = await compute_rank(uid)
     streak = await compute_streak(uid)
@@ -1218,21 +1689,7 @@ async def voice_bestfriends(
     top = sorted(pairs.items(), key=lambda x: x[1], reverse=True)[:10]
 
     medals = ["🥇", "🥈", "🥉"] + [f"{i}." for i in range(4, 11)]
-    member_cache: dict[int, str] = {}
-
-    async def label_for(uid: int) -> str:
-        if uid in member_cache:
-            return member_cache[uid]
-        m = inter.guild.get_member(uid)
-        if m is None:
-            try:
-                m = await inter.guild.fetch_member(uid)
-            except (NotFound, Forbidden, Exception):
-                member_cache[uid] = f"User {uid}"
-                return member_cache[uid]
-        name = escape_markdown(m.display_name)
-        member_cache[uid] = name
-        return name
+    label_for = member_labeler(inter.guild)
 
     lines = []
     for i, ((uid_a, uid_b), secs) in enumerate(top):
@@ -1241,7 +1698,7 @@ async def voice_bestfriends(
         lines.append(f"{medals[i]} **{name_a}** & **{name_b}** — {fmt_duration(secs)}")
 
     await inter.followup.send(
-        f"💞 **Best friends leaderboard (last {days}d):**\n" + "\n".join(lines),
+        "\n".join([f"💞 **Best friends leaderboard (last {days}d):**", *lines]),
         ephemeral=is_ephemeral,
         allowed_mentions=discord.AllowedMentions.none()
     )
@@ -1260,11 +1717,12 @@ async def voice_history(inter: discord.Interaction, private: bool = False):
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
     now = now_ts()
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
-            "SELECT channel_id, joined_ts, left_ts FROM voice_sessions "
+            "SELECT channel_id, joined_ts, COALESCE(left_ts, ?) - joined_ts AS dur, "
+            "left_ts IS NULL AS ongoing FROM voice_sessions "
             "WHERE user_id=? ORDER BY joined_ts DESC LIMIT 10",
-            (inter.user.id,)
+            (now, inter.user.id)
         ) as cur:
             rows = await cur.fetchall()
 
@@ -1273,17 +1731,15 @@ async def voice_history(inter: discord.Interaction, private: bool = False):
         return
 
     lines = []
-    for ch_id, joined_ts, left_ts in rows:
+    for ch_id, joined_ts, duration, ongoing in rows:
         channel = inter.guild.get_channel(ch_id)
         ch_name = channel.name if channel else "Unknown channel"
-        duration = (left_ts or now) - joined_ts
         date_str = ts_to_local(joined_ts)
-        ongoing = " 🔴 *ongoing*" if left_ts is None else ""
-        lines.append(f"`{date_str}` **{ch_name}** — {fmt_duration(duration)}{ongoing}")
+        tail = " 🔴 *ongoing*" if ongoing else ""
+        lines.append(f"`{date_str}` **{ch_name}** — {fmt_duration(duration)}{tail}")
 
     await inter.followup.send(
-        f"📋 **Last {len(rows)} sessions for {escape_markdown(inter.user.display_name)}:**\n"
-        + "\n".join(lines),
+        "\n".join([f"📋 **Last {len(rows)} sessions for {escape_markdown(inter.user.display_name)}:**", *lines]),
         ephemeral=is_ephemeral
     )
 
@@ -1309,12 +1765,11 @@ async def voice_marathon(
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    since = now_ts() - days * 86400
     now = now_ts()
-    afk_cond = " AND channel_id != ?" if AFK_CHANNEL_ID else ""
-    afk_params = [AFK_CHANNEL_ID] if AFK_CHANNEL_ID else []
+    since = now - days * 86400
+    afk_cond, afk_params = afk_filter_clause()
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             f"SELECT user_id, channel_id, joined_ts, "
             f"COALESCE(left_ts, ?) - joined_ts AS duration "
@@ -1329,21 +1784,7 @@ async def voice_marathon(
         await inter.followup.send("No sessions recorded in that window.", ephemeral=is_ephemeral)
         return
 
-    member_cache: dict[int, str] = {}
-
-    async def label_for(uid: int) -> str:
-        if uid in member_cache:
-            return member_cache[uid]
-        m = inter.guild.get_member(uid)
-        if m is None:
-            try:
-                m = await inter.guild.fetch_member(uid)
-            except (NotFound, Forbidden, Exception):
-                member_cache[uid] = f"User {uid}"
-                return member_cache[uid]
-        name = escape_markdown(m.display_name)
-        member_cache[uid] = name
-        return name
+    label_for = member_labeler(inter.guild)
 
     medals = ["🥇", "🥈", "🥉"] + [f"{i}." for i in range(4, 11)]
     lines = []
@@ -1355,7 +1796,7 @@ async def voice_marathon(
         lines.append(f"{medals[i]} **{name}** — {fmt_duration(duration)} in **{ch_name}** (`{date_str}`)")
 
     await inter.followup.send(
-        f"🏃 **Longest voice sessions (last {days}d):**\n" + "\n".join(lines),
+        "\n".join([f"🏃 **Longest voice sessions (last {days}d):**", *lines]),
         ephemeral=is_ephemeral,
         allowed_mentions=discord.AllowedMentions.none()
     )
@@ -1390,22 +1831,13 @@ async def voice_rivalry(
 
     now = now_ts()
     since = now - days * 86400
-    extra, params = afk_filter_clause()
     uid1, uid2 = inter.user.id, opponent.id
 
-    async with aiosqlite.connect(DB_PATH) as cx:
-        async def get_total(uid, since_ts=0):
-            async with cx.execute(
-                f"SELECT SUM(COALESCE(left_ts, ?) - joined_ts) FROM voice_sessions "
-                f"WHERE user_id=? AND joined_ts >= ?{extra}",
-                [now, uid, since_ts] + params
-            ) as c:
-                return (await c.fetchone())[0] or 0
-
-        lifetime1 = await get_total(uid1)
-        lifetime2 = await get_total(uid2)
-        recent1   = await get_total(uid1, since)
-        recent2   = await get_total(uid2, since)
+    async with db() as cx:
+        lifetime1 = await sum_user_voice_seconds(cx, uid1, now=now)
+        lifetime2 = await sum_user_voice_seconds(cx, uid2, now=now)
+        recent1   = await sum_user_voice_seconds(cx, uid1, since, now=now)
+        recent2   = await sum_user_voice_seconds(cx, uid2, since, now=now)
 
     streak1 = await compute_streak(uid1)
     streak2 = await compute_streak(uid2)
@@ -1414,7 +1846,7 @@ async def voice_rivalry(
 
     # Solo time in the window
     rows = await fetch_sessions_window(since)
-    solo_map = solo_seconds_per_user(rows, since, TZ_NAME, AFK_CHANNEL_ID or None)
+    solo_map = await asyncio.to_thread(solo_seconds_per_user, rows, since, AFK_CHANNEL_IDS or None)
     solo1 = solo_map.get(uid1, 0)
     solo2 = solo_map.get(uid2, 0)
 
@@ -1491,7 +1923,7 @@ async def voice_ghost(inter: discord.Interaction, private: bool = False):
 
     now = now_ts()
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             "SELECT user_id, MAX(COALESCE(left_ts, joined_ts)) AS last_seen "
             "FROM voice_sessions GROUP BY user_id ORDER BY last_seen ASC"
@@ -1526,7 +1958,7 @@ async def voice_ghost(inter: discord.Interaction, private: bool = False):
         return
 
     await inter.followup.send(
-        f"👻 **Most absent members:**\n" + "\n".join(lines),
+        "\n".join([f"👻 **Most absent members:**", *lines]),
         ephemeral=is_ephemeral,
         allowed_mentions=discord.AllowedMentions.none()
     )
@@ -1553,21 +1985,21 @@ async def voice_channel_stats(
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    since = now_ts() - days * 86400
     now = now_ts()
+    since = now - days * 86400
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             """
             SELECT channel_id,
                    SUM(MIN(COALESCE(left_ts, ?), ?) - MAX(joined_ts, ?)) AS total_secs,
                    COUNT(DISTINCT user_id) AS unique_users
             FROM voice_sessions
-            WHERE joined_ts < ? AND COALESCE(left_ts, ?) > ?
+            WHERE joined_ts < ? AND (left_ts IS NULL OR left_ts > ?)
             GROUP BY channel_id
             ORDER BY total_secs DESC
             """,
-            (now, now, since, now, now, since)
+            (now, now, since, now, since)
         ) as cur:
             rows = await cur.fetchall()
 
@@ -1577,7 +2009,7 @@ async def voice_channel_stats(
 
     lines = []
     for ch_id, total_secs, unique_users in rows:
-        if AFK_CHANNEL_ID and ch_id == AFK_CHANNEL_ID:
+        if ch_id in AFK_CHANNEL_IDS:
             continue
         channel = inter.guild.get_channel(ch_id)
         ch_name = channel.name if channel else f"Channel {ch_id}"
@@ -1590,7 +2022,7 @@ async def voice_channel_stats(
         return
 
     await inter.followup.send(
-        f"📡 **Channel stats (last {days}d):**\n" + "\n".join(lines),
+        "\n".join([f"📡 **Channel stats (last {days}d):**", *lines]),
         ephemeral=is_ephemeral
     )
 
@@ -1620,12 +2052,13 @@ async def voice_night_owl(
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    since = now_ts() - days * 86400
     now = now_ts()
+    since = now - days * 86400
 
     rows = await fetch_sessions_window(since)  # (user_id, channel_id, joined_ts, left_ts)
-    night_secs = aggregate_night_seconds_per_user(
-        rows, since, now, TZ_NAME, AFK_CHANNEL_ID or None, start_hour, end_hour
+    night_secs = await asyncio.to_thread(
+        aggregate_night_seconds_per_user,
+        rows, since, now, AFK_CHANNEL_IDS or None, start_hour, end_hour
     )
 
     if not night_secs:
@@ -1635,21 +2068,7 @@ async def voice_night_owl(
     top = sorted(night_secs.items(), key=lambda x: x[1], reverse=True)[:10]
     medals = ["🥇", "🥈", "🥉"] + [f"{i}." for i in range(4, 11)]
 
-    member_cache: dict[int, str] = {}
-
-    async def label_for(uid: int) -> str:
-        if uid in member_cache:
-            return member_cache[uid]
-        m = inter.guild.get_member(uid)
-        if m is None:
-            try:
-                m = await inter.guild.fetch_member(uid)
-            except (NotFound, Forbidden, Exception):
-                member_cache[uid] = f"User {uid}"
-                return member_cache[uid]
-        name = escape_markdown(m.display_name)
-        member_cache[uid] = name
-        return name
+    label_for = member_labeler(inter.guild)
 
     # Format window label e.g. "23:00–04:00"
     window_label = f"{start_hour:02d}:00–{end_hour:02d}:00"
@@ -1660,7 +2079,7 @@ async def voice_night_owl(
         lines.append(f"{medals[i]} **{name}** — {fmt_duration(secs)}")
 
     await inter.followup.send(
-        f"🦉 **Night owl leaderboard ({window_label}, last {days}d):**\n" + "\n".join(lines),
+        "\n".join([f"🦉 **Night owl leaderboard ({window_label}, last {days}d):**", *lines]),
         ephemeral=is_ephemeral,
         allowed_mentions=discord.AllowedMentions.none()
     )
@@ -1672,15 +2091,24 @@ async def voice_night_owl(
     guild=GUILD_OBJ
 )
 async def voice_report(inter: discord.Interaction, days: app_commands.Range[int, 1, 3650] = 7):
-    since = now_ts() - days * 86400
+    now = now_ts()
+    since = now - days * 86400
     extra, params = afk_filter_clause()
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
-            f"SELECT SUM(COALESCE(left_ts, strftime('%s','now')) - joined_ts) "
-            f"FROM voice_sessions WHERE user_id=? AND joined_ts>=? {extra}",
-            [inter.user.id, since] + params
+            f"SELECT SUM(seconds) FROM voice_daily_totals WHERE user_id=? AND day>=? {extra}",
+            [inter.user.id, since // 86400] + params
         ) as cur:
-            total = (await cur.fetchone())[0]
+            closed = (await cur.fetchone())[0] or 0
+        # Clamp instead of filtering on joined_ts: an open session that
+        # started before the window still counts for its in-window part.
+        async with cx.execute(
+            f"SELECT SUM(? - MAX(joined_ts, ?)) FROM voice_sessions "
+            f"WHERE user_id=? AND left_ts IS NULL {extra}",
+            [now, since, inter.user.id] + params
+        ) as cur:
+            open_secs = (await cur.fetchone())[0] or 0
+    total = closed + open_secs
     await inter.response.send_message(
         f"🎧 {inter.user.mention}: last {days}d **{fmt_duration(total)}**", ephemeral=True
     )
@@ -1700,42 +2128,30 @@ async def voice_weekdays(inter: discord.Interaction,
                          days: app_commands.Range[int, 1, 3650] = 30,
                          public: bool = True,
                          private: bool = False):
-    since = now_ts() - days * 86400
+    now = now_ts()
+    since = now - days * 86400
     is_ephemeral = (not public) or (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    async with aiosqlite.connect(DB_PATH) as cx:
-        async with cx.execute(
-            """
-            SELECT joined_ts, left_ts, channel_id
-            FROM voice_sessions
-            WHERE joined_ts < ? AND COALESCE(left_ts, strftime('%s','now')) > ?
-            """,
-            (now_ts(), since)
-        ) as cur:
-            rows = await cur.fetchall()
-
-    buckets = aggregate_seconds_by_weekday(rows, since, now_ts(), TZ_NAME, AFK_CHANNEL_ID or None)
-    labels = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-    values_hours = [s / 3600.0 for s in buckets]
-
-    plt.figure(figsize=PLOT_SIZE)
-    plt.bar(range(7), values_hours)
-    plt.xticks(range(7), labels)
-    subtitle = " (AFK excluded)" if AFK_CHANNEL_ID else ""
-    plt.title(f"Voice activity by weekday (last {days}d){subtitle}")
-    plt.ylabel("Total hours")
-    plt.xlabel("Weekday")
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close()
-    buf.seek(0)
+    cache_key = ("weekdays", days, now // 300)
+    png = cached_png(cache_key)
+    if png is None:
+        buckets = [0] * 7
+        for hour_epoch, secs in await fetch_hourly_seconds(since, now):
+            buckets[_hour_info(hour_epoch)[1]] += secs
+        values_hours = [s / 3600.0 for s in buckets]
+
+        labels = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+        subtitle = " (AFK excluded)" if AFK_CHANNEL_IDS else ""
+        png = store_png(cache_key, await asyncio.to_thread(
+            render_bar_png, labels, values_hours,
+            f"Voice activity by weekday (last {days}d){subtitle}",
+            "Weekday", "Total hours"
+        ))
 
     await inter.followup.send(
         content=f"Anonymized server-wide weekday breakdown for last **{days}d**.",
-        file=discord.File(buf, filename="voice_weekdays.png"),
+        file=discord.File(io.BytesIO(png), filename="voice_weekdays.png"),
         ephemeral=is_ephemeral
     )
 
@@ -1760,49 +2176,28 @@ async def voice_solo(inter: discord.Interaction,
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
     since = now_ts() - days * 86400
-    async with aiosqlite.connect(DB_PATH) as cx:
-        async with cx.execute(
-            """
-            SELECT user_id, channel_id, joined_ts, left_ts
-            FROM voice_sessions
-            WHERE joined_ts < ? AND COALESCE(left_ts, strftime('%s','now')) > ?
-            """,
-            (now_ts(), since)
-        ) as cur:
-            rows = await cur.fetchall()
+    rows = await fetch_sessions_window(since)
 
-    solo_totals = solo_seconds_per_user(rows, since, TZ_NAME, AFK_CHANNEL_ID or None)
+    solo_totals = await asyncio.to_thread(solo_seconds_per_user, rows, since, AFK_CHANNEL_IDS or None)
 
     if not solo_totals:
         await inter.followup.send("No solo voice time recorded in that window.", ephemeral=is_ephemeral)
         return
 
-    member_cache: dict[int, str] = {}
-
-    async def label_for(uid: int) -> str:
-        if uid in member_cache:
-            return member_cache[uid]
-        m = inter.guild.get_member(uid)
-        if m is None:
-            try:
-                m = await inter.guild.fetch_member(uid)
-            except (NotFound, Forbidden, Exception):
-                member_cache[uid] = f"User {uid}"
-                return member_cache[uid]
-        name = escape_markdown((m.nick or m.name) or str(uid))
-        member_cache[uid] = name
-        return name
+    label_for = member_labeler(inter.guild)
 
     top = sorted(solo_totals.items(), key=lambda kv: kv[1], reverse=True)[:50]
+    await label_for.prefetch([uid for uid, _ in top])
     lines = []
     for i, (uid, seconds) in enumerate(top, start=1):
         name = await label_for(uid)
         lines.append(f"{i}. {name} — {fmt_duration(seconds)}")
 
-    text = (
+    text = "\n".join([
         f"**Top 50 solo voice time (last {days}d)**"
-        f"{' (AFK excluded)' if AFK_CHANNEL_ID else ''}:\n" + "\n".join(lines)
-    )
+        f"{' (AFK excluded)' if AFK_CHANNEL_IDS else ''}:",
+        *lines,
+    ])
     await inter.followup.send(text, ephemeral=is_ephemeral, allowed_mentions=discord.AllowedMentions.none())
 
 
@@ -1829,30 +2224,20 @@ async def voice_peak(inter: discord.Interaction,
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
     rows = await fetch_sessions_window(since)
-    overall_peak, per_day_peak = peak_concurrency(rows, since, TZ_NAME, AFK_CHANNEL_ID or None)
+    overall_peak, per_day_peak = await asyncio.to_thread(
+        peak_concurrency, rows, since, AFK_CHANNEL_IDS or None
+    )
 
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
-    base = datetime.fromtimestamp(since, tz=tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    labels = [(base + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    base_ord = datetime.fromtimestamp(since, tz=LOCAL_TZ).toordinal()
+    labels = [date.fromordinal(base_ord + i).strftime("%Y-%m-%d") for i in range(days)]
     values = [per_day_peak.get(d, 0) for d in labels]
 
-    plt.figure(figsize=PLOT_SIZE)
-    x = range(len(labels))
-    plt.bar(x, values)
-    plt.xticks(x, labels, rotation=45, ha="right")
-    plt.title(f"Peak concurrent users per day (last {days}d){' (AFK excluded)' if AFK_CHANNEL_ID else ''}")
-    plt.ylabel("Peak users")
-    plt.xlabel("Day")
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close()
-    buf.seek(0)
+    png = await asyncio.to_thread(
+        render_bar_png, labels, values,
+        f"Peak concurrent users per day (last {days}d){' (AFK excluded)' if AFK_CHANNEL_IDS else ''}",
+        "Day", "Peak users", rotate_labels=True
+    )
+    buf = io.BytesIO(png)
 
     await inter.followup.send(
         content=f"**Overall peak** in last {days}d: **{overall_peak}** users.",
@@ -1884,30 +2269,20 @@ async def voice_daily_unique(inter: discord.Interaction,
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
     rows = await fetch_sessions_window(since)
-    day_users = aggregate_unique_users_by_day(rows, since, TZ_NAME, AFK_CHANNEL_ID or None)
+    day_users = await asyncio.to_thread(
+        aggregate_unique_users_by_day, rows, since, AFK_CHANNEL_IDS or None
+    )
 
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
-    base = datetime.fromtimestamp(since, tz=tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    labels = [(base + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    base_ord = datetime.fromtimestamp(since, tz=LOCAL_TZ).toordinal()
+    labels = [date.fromordinal(base_ord + i).strftime("%Y-%m-%d") for i in range(days)]
     values = [len(day_users.get(d, set())) for d in labels]
 
-    plt.figure(figsize=PLOT_SIZE)
-    x = range(len(labels))
-    plt.bar(x, values)
-    plt.xticks(x, labels, rotation=45, ha="right")
-    plt.title(f"Unique voice participants per day (last {days}d){' (AFK excluded)' if AFK_CHANNEL_ID else ''}")
-    plt.ylabel("Unique users")
-    plt.xlabel("Day")
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close()
-    buf.seek(0)
+    png = await asyncio.to_thread(
+        render_bar_png, labels, values,
+        f"Unique voice participants per day (last {days}d){' (AFK excluded)' if AFK_CHANNEL_IDS else ''}",
+        "Day", "Unique users", rotate_labels=True
+    )
+    buf = io.BytesIO(png)
 
     await inter.followup.send(
         file=discord.File(buf, "voice_daily_unique.png"),
@@ -1930,42 +2305,29 @@ async def voice_heatmap(inter: discord.Interaction,
                         days: app_commands.Range[int, 1, 3650] = 7,
                         public: bool = True,
                         private: bool = False):
-    since = now_ts() - days * 86400
+    now = now_ts()
+    since = now - days * 86400
     is_ephemeral = (not public) or (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    async with aiosqlite.connect(DB_PATH) as cx:
-        async with cx.execute(
-            """
-            SELECT joined_ts, left_ts, channel_id
-            FROM voice_sessions
-            WHERE joined_ts < ? AND COALESCE(left_ts, strftime('%s','now')) > ?
-            """,
-            (now_ts(), since)
-        ) as cur:
-            rows = await cur.fetchall()
-
-    buckets = aggregate_seconds_by_hour(rows, since, now_ts(), TZ_NAME, AFK_CHANNEL_ID or None)
-    hours = list(range(24))
-    values_hours = [s / 3600.0 for s in buckets]
-
-    plt.figure(figsize=PLOT_SIZE)
-    plt.bar(hours, values_hours)
-    plt.xticks(hours, [f"{h:02d}" for h in hours])
-    subtitle = "(AFK excluded)" if AFK_CHANNEL_ID else ""
-    plt.title(f"Voice activity by hour (last {days}d) {subtitle}")
-    plt.ylabel("Total hours")
-    plt.xlabel("Hour of day")
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close()
-    buf.seek(0)
+    cache_key = ("heatmap", days, now // 300)
+    png = cached_png(cache_key)
+    if png is None:
+        buckets = [0] * 24
+        for hour_epoch, secs in await fetch_hourly_seconds(since, now):
+            buckets[_hour_info(hour_epoch)[0]] += secs
+        values_hours = [s / 3600.0 for s in buckets]
+
+        subtitle = "(AFK excluded)" if AFK_CHANNEL_IDS else ""
+        png = store_png(cache_key, await asyncio.to_thread(
+            render_bar_png, [f"{h:02d}" for h in range(24)], values_hours,
+            f"Voice activity by hour (last {days}d) {subtitle}",
+            "Hour of day", "Total hours"
+        ))
 
     await inter.followup.send(
         content=f"Anonymized server-wide heatmap for last **{days}d**.",
-        file=discord.File(buf, filename="voice_heatmap.png"),
+        file=discord.File(io.BytesIO(png), filename="voice_heatmap.png"),
         ephemeral=is_ephemeral
     )
 
@@ -1991,46 +2353,33 @@ async def voice_daily(inter: discord.Interaction,
             return
 
     is_ephemeral = (not public) or (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
-    since = now_ts() - days * 86400
+    now = now_ts()
+    since = now - days * 86400
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    async with aiosqlite.connect(DB_PATH) as cx:
-        async with cx.execute(
-            """
-            SELECT joined_ts, left_ts, channel_id
-            FROM voice_sessions
-            WHERE joined_ts < ? AND COALESCE(left_ts, strftime('%s','now')) > ?
-            """,
-            (now_ts(), since)
-        ) as cur:
-            rows = await cur.fetchall()
-
-    buckets = aggregate_seconds_by_day(rows, since, now_ts(), TZ_NAME, AFK_CHANNEL_ID or None)
-
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
-
-    base = datetime.fromtimestamp(since, tz=tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    days_list = [(base + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
-    values_hours = [(buckets.get(day, 0) / 3600.0) for day in days_list]
-
-    plt.figure(figsize=PLOT_SIZE)
-    x = list(range(len(days_list)))
-    plt.bar(x, values_hours)
-    plt.xticks(x, days_list, rotation=45, ha="right")
-    subtitle = " (AFK excluded)" if AFK_CHANNEL_ID else ""
-    plt.title(f"Daily voice activity (last {days}d){subtitle}")
-    plt.ylabel("Hours")
-    plt.xlabel("Day")
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close()
-    buf.seek(0)
+    cache_key = ("daily", days, now // 300)
+    png = cached_png(cache_key)
+    if png is None:
+        # Index buckets by day offset from the window start instead of a
+        # date-string dict: the day ordinal comes out of the same cached
+        # lookup, so the loop is pure integer indexing.
+        base_ord = datetime.fromtimestamp(since, tz=LOCAL_TZ).toordinal()
+        buckets = [0] * days
+        for hour_epoch, secs in await fetch_hourly_seconds(since, now):
+            idx = _hour_info(hour_epoch)[3] - base_ord
+            if 0 <= idx < days:
+                buckets[idx] += secs
+
+        days_list = [date.fromordinal(base_ord + i).strftime("%Y-%m-%d") for i in range(days)]
+        values_hours = [s / 3600.0 for s in buckets]
+
+        subtitle = " (AFK excluded)" if AFK_CHANNEL_IDS else ""
+        png = store_png(cache_key, await asyncio.to_thread(
+            render_bar_png, days_list, values_hours,
+            f"Daily voice activity (last {days}d){subtitle}",
+            "Day", "Hours", rotate_labels=True
+        ))
+    buf = io.BytesIO(png)
 
     await inter.followup.send(
         content=f"Anonymized server-wide daily totals for last **{days}d**.",
@@ -2041,14 +2390,21 @@ async def voice_daily(inter: discord.Interaction,
 
 @tree.command(name="voice_total", description="Show YOUR lifetime total voice time.", guild=GUILD_OBJ)
 async def voice_total(inter: discord.Interaction):
+    now = now_ts()
     extra, params = afk_filter_clause()
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
-            f"SELECT SUM(COALESCE(left_ts, strftime('%s','now')) - joined_ts) "
-            f"FROM voice_sessions WHERE user_id=? {extra}",
+            f"SELECT SUM(seconds) FROM voice_daily_totals WHERE user_id=? {extra}",
             [inter.user.id] + params
         ) as cur:
-            total = (await cur.fetchone())[0]
+            closed = (await cur.fetchone())[0] or 0
+        async with cx.execute(
+            f"SELECT SUM(? - joined_ts) FROM voice_sessions "
+            f"WHERE user_id=? AND left_ts IS NULL {extra}",
+            [now, inter.user.id] + params
+        ) as cur:
+            open_secs = (await cur.fetchone())[0] or 0
+    total = closed + open_secs
     await inter.response.send_message(
         f"📊 {inter.user.mention}: lifetime **{fmt_duration(total)}**", ephemeral=True
     )
@@ -2060,12 +2416,26 @@ async def voice_total(inter: discord.Interaction):
 )
 async def voice_current(inter: discord.Interaction, private: bool = False):
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
-    lines = []
-    for vc in inter.guild.voice_channels:
-        if vc.members:
-            names = ", ".join(m.display_name for m in vc.members)
-            lines.append(f"🔊 **{vc.name}**: {names}")
-    msg = "\n".join(lines) if lines else "No one is in voice right now."
+    guild = inter.guild
+    # The voice-state cache is one dict of everyone in voice; grouping it by
+    # channel skips the walk over every (mostly empty) voice channel.
+    states = getattr(guild, "_voice_states", None)
+    by_channel: dict[discord.VoiceChannel, list[str]] = defaultdict(list)
+    if states is not None:
+        for uid, st in states.items():
+            if st.channel is None:
+                continue
+            m = guild.get_member(uid)
+            if m is not None:
+                by_channel[st.channel].append(m.display_name)
+    else:
+        for vc in guild.voice_channels:
+            for m in vc.members:
+                by_channel[vc].append(m.display_name)
+    msg = "\n".join(
+        f"🔊 **{vc.name}**: {', '.join(names)}"
+        for vc, names in by_channel.items() if names
+    ) or "No one is in voice right now."
     await inter.response.send_message(msg, ephemeral=is_ephemeral)
 
 
@@ -2084,51 +2454,45 @@ async def voice_top(inter: discord.Interaction,
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    since = now_ts() - days * 86400
+    now = now_ts()
+    since = now - days * 86400
     extra, params = afk_filter_clause()
 
-    # FIX: overlapping-window WHERE so sessions that started before 'since'
-    # but were still active during the window are included
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
+        # Closed sessions come pre-aggregated from the daily rollup...
         async with cx.execute(f"""
-            SELECT user_id,
-                   SUM(COALESCE(left_ts, strftime('%s','now')) - joined_ts) AS total
+            SELECT user_id, SUM(seconds) AS total
+            FROM voice_daily_totals
+            WHERE day >= ? {extra}
+            GROUP BY user_id
+        """, [since // 86400] + params) as cur:
+            totals = {uid: secs for uid, secs in await cur.fetchall()}
+
+        # ...plus the still-open sessions, clamped to the window.
+        async with cx.execute(f"""
+            SELECT user_id, SUM(? - MAX(joined_ts, ?)) AS total
             FROM voice_sessions
-            WHERE joined_ts < strftime('%s','now')
-              AND COALESCE(left_ts, strftime('%s','now')) > ?
-              {extra}
+            WHERE left_ts IS NULL AND joined_ts < ? {extra}
             GROUP BY user_id
-            ORDER BY total DESC
-            LIMIT 50
-        """, [since] + params) as cur:
-            rows = await cur.fetchall()
+        """, [now, since, now] + params) as cur:
+            for uid, secs in await cur.fetchall():
+                totals[uid] = totals.get(uid, 0) + (secs or 0)
+
+    rows = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:50]
 
     if not rows:
         await inter.followup.send("No voice activity in that window.", ephemeral=is_ephemeral)
         return
 
-    member_cache: dict[int, str] = {}
+    label_for = member_labeler(inter.guild)
+    await label_for.prefetch([uid for uid, _ in rows])
 
-    async def label_for(uid: int) -> str:
-        if uid in member_cache:
-            return member_cache[uid]
-        m = inter.guild.get_member(uid)
-        if m is None:
-            try:
-                m = await inter.guild.fetch_member(uid)
-            except (NotFound, Forbidden, Exception):
-                member_cache[uid] = f"User {uid}"
-                return member_cache[uid]
-        name = escape_markdown((m.nick or m.name) or str(uid))
-        member_cache[uid] = name
-        return name
-
-    lines = []
-    for i, (uid, total) in enumerate(rows, start=1):
-        name = await label_for(uid)
-        lines.append(f"{i}. {name} — {fmt_duration(total)}")
+    lines = [
+        f"{i}. {await label_for(uid)} — {fmt_duration(total)}"
+        for i, (uid, total) in enumerate(rows, start=1)
+    ]
 
-    text = f"**Top 50 voice users (last {days}d):**\n" + "\n".join(lines)
+    text = "\n".join([f"**Top 50 voice users (last {days}d):**", *lines])
     await inter.followup.send(text, ephemeral=is_ephemeral, allowed_mentions=discord.AllowedMentions.none())
 
 
@@ -2144,7 +2508,7 @@ async def voice_streak_board(inter: discord.Interaction, private: bool = False):
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute("SELECT DISTINCT user_id FROM voice_sessions") as cur:
             user_rows = await cur.fetchall()
 
@@ -2163,20 +2527,7 @@ async def voice_streak_board(inter: discord.Interaction, private: bool = False):
     streak_data.sort(key=lambda x: x[1], reverse=True)
     top = streak_data[:15]
 
-    member_cache: dict[int, str] = {}
-
-    async def label_for(uid: int) -> str:
-        if uid in member_cache:
-            return member_cache[uid]
-        m = inter.guild.get_member(uid)
-        if m is None:
-            try:
-                m = await inter.guild.fetch_member(uid)
-            except (NotFound, Forbidden, Exception):
-                member_cache[uid] = f"User {uid}"
-                return member_cache[uid]
-        member_cache[uid] = escape_markdown(m.display_name)
-        return member_cache[uid]
+    label_for = member_labeler(inter.guild)
 
     names = []
     streaks = []
@@ -2185,22 +2536,21 @@ async def voice_streak_board(inter: discord.Interaction, private: bool = False):
         streaks.append(streak)
 
     max_streak = max(streaks)
-    colors = [plt.cm.RdYlGn(s / max_streak) for s in streaks]
-
-    plt.figure(figsize=PLOT_SIZE)
-    bars = plt.bar(range(len(names)), streaks, color=colors)
-    plt.xticks(range(len(names)), names, rotation=30, ha="right")
-    plt.ylabel("Streak (days)")
-    plt.title("Current daily voice streaks 🔥")
-    for bar, s in zip(bars, streaks):
-        plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + 0.1,
-                 str(s), ha="center", va="bottom", fontsize=9)
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close()
-    buf.seek(0)
+
+    def _render() -> bytes:
+        colors = [matplotlib.colormaps["RdYlGn"](s / max_streak) for s in streaks]
+        fig, ax = new_chart()
+        bars = ax.bar(range(len(names)), streaks, color=colors)
+        ax.set_xticks(range(len(names)), names, rotation=30, ha="right")
+        ax.set_ylabel("Streak (days)")
+        ax.set_title("Current daily voice streaks 🔥")
+        for bar, s in zip(bars, streaks):
+            ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + 0.1,
+                     str(s), ha="center", va="bottom", fontsize=9)
+        fig.tight_layout()
+        return fig_to_png(fig)
+
+    buf = io.BytesIO(await asyncio.to_thread(_render))
 
     medals = ["🥇", "🥈", "🥉"] + [f"{i}." for i in range(4, 16)]
     lines = [
@@ -2208,7 +2558,7 @@ async def voice_streak_board(inter: discord.Interaction, private: bool = False):
         for i in range(len(names))
     ]
     await inter.followup.send(
-        content="🔥 **Voice streak leaderboard:**\n" + "\n".join(lines),
+        content="\n".join(["🔥 **Voice streak leaderboard:**", *lines]),
         file=discord.File(buf, "voice_streaks.png"),
         ephemeral=is_ephemeral,
         allowed_mentions=discord.AllowedMentions.none()
@@ -2224,46 +2574,42 @@ async def voice_streak_board(inter: discord.Interaction, private: bool = False):
 async def voice_my_chart(inter: discord.Interaction, days: app_commands.Range[int, 1, 365] = 14):
     await inter.response.defer(thinking=True, ephemeral=True)
 
-    since = now_ts() - days * 86400
+    now = now_ts()
+    since = now - days * 86400
     uid = inter.user.id
     extra, params = afk_filter_clause()
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             f"SELECT joined_ts, left_ts, channel_id FROM voice_sessions "
-            f"WHERE user_id=? AND joined_ts < ? AND COALESCE(left_ts, strftime('%s','now')) > ?{extra}",
-            [uid, now_ts(), since] + params
+            f"WHERE user_id=? AND joined_ts < ? AND (left_ts IS NULL OR left_ts > ?){extra}",
+            [uid, now, since] + params
         ) as cur:
             rows = await cur.fetchall()
 
-    buckets = aggregate_seconds_by_day(rows, since, now_ts(), TZ_NAME, AFK_CHANNEL_ID or None)
-
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
+    buckets = await asyncio.to_thread(
+        aggregate_seconds_by_day, rows, since, now, AFK_CHANNEL_IDS or None
+    )
 
-    base = datetime.fromtimestamp(since, tz=tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    days_list = [(base + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    base_ord = datetime.fromtimestamp(since, tz=LOCAL_TZ).toordinal()
+    days_list = [date.fromordinal(base_ord + i).strftime("%Y-%m-%d") for i in range(days)]
     values_hours = [buckets.get(d, 0) / 3600.0 for d in days_list]
 
-    plt.figure(figsize=PLOT_SIZE)
-    x = list(range(len(days_list)))
-    plt.fill_between(x, values_hours, alpha=0.35)
-    plt.plot(x, values_hours, marker="o", markersize=4, linewidth=1.5)
-    step = max(1, len(x) // 14)
-    plt.xticks(x[::step], days_list[::step], rotation=45, ha="right")
-    subtitle = " (AFK excluded)" if AFK_CHANNEL_ID else ""
-    plt.title(f"{escape_markdown(inter.user.display_name)} — daily voice (last {days}d){subtitle}")
-    plt.ylabel("Hours")
-    plt.xlabel("Day")
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close()
-    buf.seek(0)
+    def _render() -> bytes:
+        fig, ax = new_chart()
+        x = list(range(len(days_list)))
+        ax.fill_between(x, values_hours, alpha=0.35)
+        ax.plot(x, values_hours, marker="o", markersize=4, linewidth=1.5)
+        step = max(1, len(x) // 14)
+        ax.set_xticks(x[::step], days_list[::step], rotation=45, ha="right")
+        subtitle = " (AFK excluded)" if AFK_CHANNEL_IDS else ""
+        ax.set_title(f"{escape_markdown(inter.user.display_name)} — daily voice (last {days}d){subtitle}")
+        ax.set_ylabel("Hours")
+        ax.set_xlabel("Day")
+        fig.tight_layout()
+        return fig_to_png(fig)
+
+    buf = io.BytesIO(await asyncio.to_thread(_render))
 
     total_h = sum(values_hours)
     avg_h = total_h / days if days else 0
@@ -2300,26 +2646,23 @@ async def voice_growth(
     is_ephemeral = (not public) or (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    since = now_ts() - days * 86400
+    now = now_ts()
+    since = now - days * 86400
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             "SELECT joined_ts, left_ts, channel_id FROM voice_sessions "
-            "WHERE joined_ts < ? AND COALESCE(left_ts, strftime('%s','now')) > ?",
-            (now_ts(), since)
+            "WHERE joined_ts < ? AND (left_ts IS NULL OR left_ts > ?)",
+            (now, since)
         ) as cur:
             rows = await cur.fetchall()
 
-    daily = aggregate_seconds_by_day(rows, since, now_ts(), TZ_NAME, AFK_CHANNEL_ID or None)
-
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
+    daily = await asyncio.to_thread(
+        aggregate_seconds_by_day, rows, since, now, AFK_CHANNEL_IDS or None
+    )
 
-    base = datetime.fromtimestamp(since, tz=tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    days_list = [(base + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    base_ord = datetime.fromtimestamp(since, tz=LOCAL_TZ).toordinal()
+    days_list = [date.fromordinal(base_ord + i).strftime("%Y-%m-%d") for i in range(days)]
 
     cumulative = []
     running = 0.0
@@ -2327,28 +2670,27 @@ async def voice_growth(
         running += daily.get(d, 0) / 3600.0
         cumulative.append(running)
 
-    step = max(1, len(days_list) // 10)
-    plt.figure(figsize=PLOT_SIZE)
-    x = list(range(len(days_list)))
-    plt.fill_between(x, cumulative, alpha=0.25)
-    plt.plot(x, cumulative, linewidth=2)
-    plt.xticks(x[::step], days_list[::step], rotation=45, ha="right")
-    subtitle = " (AFK excluded)" if AFK_CHANNEL_ID else ""
-    plt.title(f"Cumulative voice hours (last {days}d){subtitle}")
-    plt.ylabel("Cumulative hours")
-    plt.xlabel("Day")
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close()
-    buf.seek(0)
+    def _render() -> bytes:
+        step = max(1, len(days_list) // 10)
+        fig, ax = new_chart()
+        x = list(range(len(days_list)))
+        ax.fill_between(x, cumulative, alpha=0.25)
+        ax.plot(x, cumulative, linewidth=2)
+        ax.set_xticks(x[::step], days_list[::step], rotation=45, ha="right")
+        subtitle = " (AFK excluded)" if AFK_CHANNEL_IDS else ""
+        ax.set_title(f"Cumulative voice hours (last {days}d){subtitle}")
+        ax.set_ylabel("Cumulative hours")
+        ax.set_xlabel("Day")
+        fig.tight_layout()
+        return fig_to_png(fig)
+
+    buf = io.BytesIO(await asyncio.to_thread(_render))
 
     total_h = cumulative[-1] if cumulative else 0.0
     await inter.followup.send(
         content=(
             f"📈 **Cumulative voice hours (last {days}d):** **{total_h:.1f}h** total"
-            f"{' (AFK excluded)' if AFK_CHANNEL_ID else ''}"
+            f"{' (AFK excluded)' if AFK_CHANNEL_IDS else ''}"
         ),
         file=discord.File(buf, "voice_growth.png"),
         ephemeral=is_ephemeral
@@ -2372,7 +2714,7 @@ async def voice_milestones(
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             "SELECT user_id, hours, awarded_ts FROM milestones ORDER BY awarded_ts DESC LIMIT ?",
             (limit,)
@@ -2391,7 +2733,7 @@ async def voice_milestones(
         lines.append(f"🏆 **{name}** hit **{hours}h** — `{date_str}`")
 
     await inter.followup.send(
-        "🏆 **Recent voice milestones:**\n" + "\n".join(lines),
+        "\n".join(["🏆 **Recent voice milestones:**", *lines]),
         ephemeral=is_ephemeral,
         allowed_mentions=discord.AllowedMentions.none()
     )
@@ -2421,45 +2763,33 @@ async def voice_session_count(
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
     since = now_ts() - days * 86400
-    afk_cond = " AND channel_id != ?" if AFK_CHANNEL_ID else ""
-    afk_params = [AFK_CHANNEL_ID] if AFK_CHANNEL_ID else []
+    afk_cond, afk_params = afk_filter_clause()
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             f"SELECT joined_ts FROM voice_sessions WHERE joined_ts >= ?{afk_cond}",
             [since] + afk_params
         ) as cur:
             rows = await cur.fetchall()
 
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
+    tz = LOCAL_TZ
 
     counts: dict[str, int] = {}
     for (joined_ts,) in rows:
         day_key = datetime.fromtimestamp(joined_ts, tz=tz).strftime("%Y-%m-%d")
         counts[day_key] = counts.get(day_key, 0) + 1
 
-    base = datetime.fromtimestamp(since, tz=tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    days_list = [(base + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    base_ord = datetime.fromtimestamp(since, tz=tz).toordinal()
+    days_list = [date.fromordinal(base_ord + i).strftime("%Y-%m-%d") for i in range(days)]
     values = [counts.get(d, 0) for d in days_list]
 
-    plt.figure(figsize=PLOT_SIZE)
-    x = list(range(len(days_list)))
-    plt.bar(x, values)
-    plt.xticks(x, days_list, rotation=45, ha="right")
-    subtitle = " (AFK excluded)" if AFK_CHANNEL_ID else ""
-    plt.title(f"Voice sessions started per day (last {days}d){subtitle}")
-    plt.ylabel("Sessions")
-    plt.xlabel("Day")
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close()
-    buf.seek(0)
+    subtitle = " (AFK excluded)" if AFK_CHANNEL_IDS else ""
+    png = await asyncio.to_thread(
+        render_bar_png, days_list, values,
+        f"Voice sessions started per day (last {days}d){subtitle}",
+        "Day", "Sessions", rotate_labels=True
+    )
+    buf = io.BytesIO(png)
 
     total_s = sum(values)
     avg_s = total_s / days if days else 0
@@ -2467,7 +2797,7 @@ async def voice_session_count(
         content=(
             f"📊 **Sessions per day (last {days}d):** "
             f"**{total_s}** total, avg **{avg_s:.1f}/day**"
-            f"{' (AFK excluded)' if AFK_CHANNEL_ID else ''}"
+            f"{' (AFK excluded)' if AFK_CHANNEL_IDS else ''}"
         ),
         file=discord.File(buf, "voice_session_count.png"),
         ephemeral=is_ephemeral
@@ -2487,10 +2817,9 @@ async def voice_server_overview(inter: discord.Interaction, private: bool = Fals
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
     now = now_ts()
-    afk_cond = " AND channel_id != ?" if AFK_CHANNEL_ID else ""
-    afk_params = [AFK_CHANNEL_ID] if AFK_CHANNEL_ID else []
+    afk_cond, afk_params = afk_filter_clause()
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             f"SELECT COUNT(*), COUNT(DISTINCT user_id), "
             f"SUM(COALESCE(left_ts, ?) - joined_ts), "
@@ -2515,7 +2844,7 @@ async def voice_server_overview(inter: discord.Interaction, private: bool = Fals
     currently_active = sum(
         1 for vc in inter.guild.voice_channels
         for m in vc.members
-        if not (AFK_CHANNEL_ID and vc.id == AFK_CHANNEL_ID)
+        if vc.id not in AFK_CHANNEL_IDS
     )
 
     top_ch_name = "N/A"
@@ -2533,7 +2862,7 @@ async def voice_server_overview(inter: discord.Interaction, private: bool = Fals
     embed.add_field(name="⏲️ Avg session length",   value=fmt_duration(int(avg_session_secs)), inline=True)
     embed.add_field(name="🔊 Most popular channel", value=top_ch_name,                       inline=True)
     embed.add_field(name="🟢 In voice now",         value=str(currently_active),             inline=True)
-    if AFK_CHANNEL_ID:
+    if AFK_CHANNEL_IDS:
         embed.set_footer(text="AFK channel excluded from all figures.")
     await inter.followup.send(embed=embed, ephemeral=is_ephemeral)
 
@@ -2548,22 +2877,10 @@ async def voice_next_milestone(inter: discord.Interaction):
 
     now = now_ts()
     uid = inter.user.id
-    extra, params = afk_filter_clause()
-
-    async with aiosqlite.connect(DB_PATH) as cx:
-        async with cx.execute(
-            f"SELECT SUM(COALESCE(left_ts, ?) - joined_ts) FROM voice_sessions WHERE user_id=?{extra}",
-            [now, uid] + params
-        ) as cur:
-            total_secs = (await cur.fetchone())[0] or 0
 
-        since_7 = now - 7 * 86400
-        async with cx.execute(
-            f"SELECT SUM(COALESCE(left_ts, ?) - joined_ts) FROM voice_sessions "
-            f"WHERE user_id=? AND joined_ts >= ?{extra}",
-            [now, uid, since_7] + params
-        ) as cur:
-            last7_secs = (await cur.fetchone())[0] or 0
+    async with db() as cx:
+        total_secs = await sum_user_voice_seconds(cx, uid, now=now)
+        last7_secs = await sum_user_voice_seconds(cx, uid, now - 7 * 86400, now=now)
 
     total_hours = total_secs / 3600.0
     pace_h_per_day = (last7_secs / 3600.0) / 7
@@ -2623,23 +2940,23 @@ async def voice_leaderboard_chart(
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    since = now_ts() - days * 86400
     now = now_ts()
+    since = now - days * 86400
     extra, params = afk_filter_clause()
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             f"""
             SELECT user_id,
                    SUM(MIN(COALESCE(left_ts, ?), ?) - MAX(joined_ts, ?)) AS total
             FROM voice_sessions
-            WHERE joined_ts < ? AND COALESCE(left_ts, ?) > ?
+            WHERE joined_ts < ? AND (left_ts IS NULL OR left_ts > ?)
             {extra}
             GROUP BY user_id
             ORDER BY total DESC
             LIMIT 15
             """,
-            [now, now, since, now, now, since] + params
+            [now, now, since, now, since] + params
         ) as cur:
             rows = await cur.fetchall()
 
@@ -2661,26 +2978,25 @@ async def voice_leaderboard_chart(
         hours.append(total_secs / 3600.0)
 
     max_h = max(hours) if hours else 1
-    colors = [plt.cm.RdYlGn(h / max_h) for h in hours]
-
-    fig, ax = plt.subplots(figsize=(8, max(4, len(names) * 0.55)))
-    y_pos = range(len(names))
-    bars = ax.barh(list(y_pos), hours, color=colors)
-    ax.set_yticks(list(y_pos))
-    ax.set_yticklabels(names)
-    ax.invert_yaxis()
-    ax.set_xlabel("Hours")
-    subtitle = " (AFK excluded)" if AFK_CHANNEL_ID else ""
-    ax.set_title(f"Top voice users (last {days}d){subtitle}")
-    for bar, h in zip(bars, hours):
-        ax.text(bar.get_width() + max_h * 0.01, bar.get_y() + bar.get_height() / 2,
-                fmt_duration(int(h * 3600)), va="center", fontsize=8)
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close()
-    buf.seek(0)
+
+    def _render() -> bytes:
+        colors = [matplotlib.colormaps["RdYlGn"](h / max_h) for h in hours]
+        fig, ax = new_chart(figsize=(8, max(4, len(names) * 0.55)))
+        y_pos = range(len(names))
+        bars = ax.barh(list(y_pos), hours, color=colors)
+        ax.set_yticks(list(y_pos))
+        ax.set_yticklabels(names)
+        ax.invert_yaxis()
+        ax.set_xlabel("Hours")
+        subtitle = " (AFK excluded)" if AFK_CHANNEL_IDS else ""
+        ax.set_title(f"Top voice users (last {days}d){subtitle}")
+        for bar, h in zip(bars, hours):
+            ax.text(bar.get_width() + max_h * 0.01, bar.get_y() + bar.get_height() / 2,
+                    fmt_duration(int(h * 3600)), va="center", fontsize=8)
+        fig.tight_layout()
+        return fig_to_png(fig)
+
+    buf = io.BytesIO(await asyncio.to_thread(_render))
 
     await inter.followup.send(
         content=f"📊 **Top {len(names)} voice users (last {days}d)**",
@@ -2702,7 +3018,7 @@ async def voice_best_day(inter: discord.Interaction):
     now = now_ts()
     extra, params = afk_filter_clause()
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             f"SELECT joined_ts, COALESCE(left_ts, ?), channel_id "
             f"FROM voice_sessions WHERE user_id=?{extra}",
@@ -2714,7 +3030,9 @@ async def voice_best_day(inter: discord.Interaction):
         await inter.followup.send("No voice sessions recorded yet.", ephemeral=True)
         return
 
-    day_buckets = aggregate_seconds_by_day(rows, 0, now, TZ_NAME, AFK_CHANNEL_ID or None)
+    day_buckets = await asyncio.to_thread(
+        aggregate_seconds_by_day, rows, 0, now, AFK_CHANNEL_IDS or None
+    )
 
     if not day_buckets:
         await inter.followup.send("Not enough data to compute best days.", ephemeral=True)
@@ -2762,12 +3080,13 @@ async def voice_early_bird(
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    since = now_ts() - days * 86400
     now = now_ts()
+    since = now - days * 86400
 
     rows = await fetch_sessions_window(since)
-    morning_secs = aggregate_night_seconds_per_user(
-        rows, since, now, TZ_NAME, AFK_CHANNEL_ID or None, start_hour, end_hour
+    morning_secs = await asyncio.to_thread(
+        aggregate_night_seconds_per_user,
+        rows, since, now, AFK_CHANNEL_IDS or None, start_hour, end_hour
     )
 
     if not morning_secs:
@@ -2776,21 +3095,7 @@ async def voice_early_bird(
 
     top = sorted(morning_secs.items(), key=lambda x: x[1], reverse=True)[:10]
     medals = ["🥇", "🥈", "🥉"] + [f"{i}." for i in range(4, 11)]
-    member_cache: dict[int, str] = {}
-
-    async def label_for(uid: int) -> str:
-        if uid in member_cache:
-            return member_cache[uid]
-        m = inter.guild.get_member(uid)
-        if m is None:
-            try:
-                m = await inter.guild.fetch_member(uid)
-            except (NotFound, Forbidden, Exception):
-                member_cache[uid] = f"User {uid}"
-                return member_cache[uid]
-        name = escape_markdown(m.display_name)
-        member_cache[uid] = name
-        return name
+    label_for = member_labeler(inter.guild)
 
     window_label = f"{start_hour:02d}:00–{end_hour:02d}:00"
     lines = []
@@ -2799,7 +3104,7 @@ async def voice_early_bird(
         lines.append(f"{medals[i]} **{name}** — {fmt_duration(secs)}")
 
     await inter.followup.send(
-        f"🌅 **Early bird leaderboard ({window_label}, last {days}d):**\n" + "\n".join(lines),
+        "\n".join([f"🌅 **Early bird leaderboard ({window_label}, last {days}d):**", *lines]),
         ephemeral=is_ephemeral,
         allowed_mentions=discord.AllowedMentions.none()
     )
@@ -2828,24 +3133,19 @@ async def voice_consistency(
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    since = now_ts() - days * 86400
     now = now_ts()
+    since = now - days * 86400
 
-    try:
-        import zoneinfo
-        tz = zoneinfo.ZoneInfo(TZ_NAME)
-    except Exception:
-        tz = timezone.utc
+    tz = LOCAL_TZ
 
-    afk_cond = " AND channel_id != ?" if AFK_CHANNEL_ID else ""
-    afk_params = [AFK_CHANNEL_ID] if AFK_CHANNEL_ID else []
+    afk_cond, afk_params = afk_filter_clause()
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             f"SELECT user_id, joined_ts, COALESCE(left_ts, ?)"
             f" FROM voice_sessions"
-            f" WHERE joined_ts < ? AND COALESCE(left_ts, ?) > ?{afk_cond}",
-            [now, now, now, since] + afk_params
+            f" WHERE joined_ts < ? AND (left_ts IS NULL OR left_ts > ?){afk_cond}",
+            [now, now, since] + afk_params
         ) as cur:
             rows = await cur.fetchall()
 
@@ -2884,20 +3184,7 @@ async def voice_consistency(
         return
 
     medals = ["🥇", "🥈", "🥉"] + [f"{i}." for i in range(4, 11)]
-    member_cache: dict[int, str] = {}
-
-    async def label_for(uid: int) -> str:
-        if uid in member_cache:
-            return member_cache[uid]
-        m = inter.guild.get_member(uid)
-        if m is None:
-            try:
-                m = await inter.guild.fetch_member(uid)
-            except (NotFound, Forbidden, Exception):
-                member_cache[uid] = f"User {uid}"
-                return member_cache[uid]
-        member_cache[uid] = escape_markdown(m.display_name)
-        return member_cache[uid]
+    label_for = member_labeler(inter.guild)
 
     lines = []
     for i, (uid, active_days, pct) in enumerate(top):
@@ -2905,7 +3192,7 @@ async def voice_consistency(
         lines.append(f"{medals[i]} **{name}** — {pct:.0f}% ({active_days}/{days} days)")
 
     await inter.followup.send(
-        f"📅 **Consistency leaderboard (last {days}d, min {min_days} active days):**\n" + "\n".join(lines),
+        "\n".join([f"📅 **Consistency leaderboard (last {days}d, min {min_days} active days):**", *lines]),
         ephemeral=is_ephemeral,
         allowed_mentions=discord.AllowedMentions.none()
     )
@@ -2932,15 +3219,15 @@ async def voice_binge(
     is_ephemeral = (private and inter.user.id == VOICE_TOP_PRIVATE_USER)
     await inter.response.defer(thinking=True, ephemeral=is_ephemeral)
 
-    since = now_ts() - days * 86400
     now = now_ts()
+    since = now - days * 86400
 
-    async with aiosqlite.connect(DB_PATH) as cx:
+    async with db() as cx:
         async with cx.execute(
             """SELECT user_id, channel_id, joined_ts, left_ts
                FROM voice_sessions
-               WHERE joined_ts < ? AND COALESCE(left_ts, ?) > ?""",
-            (now, now, since)
+               WHERE joined_ts < ? AND (left_ts IS NULL OR left_ts > ?)""",
+            (now, since)
         ) as cur:
             rows = await cur.fetchall()
 
@@ -2949,17 +3236,21 @@ async def voice_binge(
         return
 
     # Per-user per-day totals
-    user_day_secs: dict[int, dict[str, int]] = {}
-    for uid, ch_id, joined_ts, left_ts in rows:
-        if AFK_CHANNEL_ID and ch_id == AFK_CHANNEL_ID:
-            continue
-        # reuse existing helper on a per-user basis
-        day_buckets = aggregate_seconds_by_day(
-            [(joined_ts, left_ts, ch_id)], since, now, TZ_NAME, AFK_CHANNEL_ID or None
-        )
-        uid_days = user_day_secs.setdefault(uid, {})
-        for day, secs in day_buckets.items():
-            uid_days[day] = uid_days.get(day, 0) + secs
+    def _per_user_days() -> dict[int, dict[str, int]]:
+        user_day_secs: dict[int, dict[str, int]] = {}
+        for uid, ch_id, joined_ts, left_ts in rows:
+            if ch_id in AFK_CHANNEL_IDS:
+                continue
+            # reuse existing helper on a per-user basis
+            day_buckets = aggregate_seconds_by_day(
+                [(joined_ts, left_ts, ch_id)], since, now, AFK_CHANNEL_IDS or None
+            )
+            uid_days = user_day_secs.setdefault(uid, {})
+            for day, secs in day_buckets.items():
+                uid_days[day] = uid_days.get(day, 0) + secs
+        return user_day_secs
+
+    user_day_secs = await asyncio.to_thread(_per_user_days)
 
     # Best single day per user
     best: list[tuple[int, str, int]] = []
@@ -2973,20 +3264,7 @@ async def voice_binge(
     top = best[:10]
 
     medals = ["🥇", "🥈", "🥉"] + [f"{i}." for i in range(4, 11)]
-    member_cache: dict[int, str] = {}
-
-    async def label_for(uid: int) -> str:
-        if uid in member_cache:
-            return member_cache[uid]
-        m = inter.guild.get_member(uid)
-        if m is None:
-            try:
-                m = await inter.guild.fetch_member(uid)
-            except (NotFound, Forbidden, Exception):
-                member_cache[uid] = f"User {uid}"
-                return member_cache[uid]
-        member_cache[uid] = escape_markdown(m.display_name)
-        return member_cache[uid]
+    label_for = member_labeler(inter.guild)
 
     lines = []
     for i, (uid, day_key, secs) in enumerate(top):
@@ -2994,7 +3272,7 @@ async def voice_binge(
         lines.append(f"{medals[i]} **{name}** — {fmt_duration(secs)} on `{day_key}`")
 
     await inter.followup.send(
-        f"🔥 **Biggest single-day binge (last {days}d):**\n" + "\n".join(lines),
+        "\n".join([f"🔥 **Biggest single-day binge (last {days}d):**", *lines]),
         ephemeral=is_ephemeral,
         allowed_mentions=discord.AllowedMentions.none()
     )
@@ -3099,7 +3377,11 @@ async def voice_weekly_role(inter: discord.Interaction):
 
 
 # -------- Run --------
-if __name__ == "__main__":
+def main():
     if not TOKEN:
         raise SystemExit("DISCORD_TOKEN missing in .env")
-    client.run(TOKEN)
\ No newline at end of file
+    client.run(TOKEN)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
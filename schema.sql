@@ -5,8 +5,34 @@ CREATE TABLE IF NOT EXISTS voice_sessions (
   user_id INTEGER NOT NULL,
   channel_id INTEGER NOT NULL,
   joined_ts INTEGER NOT NULL,
-  left_ts INTEGER
+  left_ts INTEGER,
+  -- Duration of a closed session; NULL while the session is open.
+  duration INTEGER GENERATED ALWAYS AS (left_ts - joined_ts) VIRTUAL
 );
 
-CREATE INDEX IF NOT EXISTS idx_voice_open ON voice_sessions(user_id) WHERE left_ts IS NULL;
-CREATE INDEX IF NOT EXISTS idx_voice_join ON voice_sessions(joined_ts);
+CREATE TABLE IF NOT EXISTS milestones (
+  user_id  INTEGER NOT NULL,
+  hours    INTEGER NOT NULL,
+  awarded_ts INTEGER NOT NULL,
+  PRIMARY KEY (user_id, hours)
+);
+
+-- Pre-aggregated per-user/per-channel/per-UTC-day totals for closed sessions.
+CREATE TABLE IF NOT EXISTS voice_daily_totals (
+  user_id    INTEGER NOT NULL,
+  channel_id INTEGER NOT NULL,
+  day        INTEGER NOT NULL,   -- unix epoch day (UTC)
+  seconds    INTEGER NOT NULL,
+  PRIMARY KEY (user_id, channel_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_voice_open2
+  ON voice_sessions(user_id, channel_id, joined_ts) WHERE left_ts IS NULL;
+CREATE INDEX IF NOT EXISTS idx_voice_user_join
+  ON voice_sessions(user_id, joined_ts, channel_id, left_ts, duration);
+CREATE INDEX IF NOT EXISTS idx_voice_join_user
+  ON voice_sessions(joined_ts, user_id, channel_id, left_ts);
+CREATE INDEX IF NOT EXISTS idx_rollup_day
+  ON voice_daily_totals(day, channel_id, user_id, seconds);
+CREATE INDEX IF NOT EXISTS idx_voice_left
+  ON voice_sessions(left_ts) WHERE left_ts IS NOT NULL;